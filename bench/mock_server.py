@@ -0,0 +1,307 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# 最新一条动态的发布时间, 更早的动态按 DYNAMIC_INTERVAL 依次往前
+NEWEST_TS = 1700000000
+DYNAMIC_INTERVAL = 6 * 3600
+PAGE_SIZE = 12
+REPLY_PAGE_SIZE = 20
+IMAGE_PATTERN = re.compile(r"^/bfs/new_dyn/([0-9a-f]{32})\.(\w+)(@[\w.]+)?$")
+
+class MockOptions:
+    """模拟服务器的数据规模与故障注入参数"""
+    def __init__(self, users=3, dynamics=60, max_pics=4, max_comments=60, reply_pic_rate=0.2,
+                 image_kb=200, api_latency=0.05, image_latency=0.02, error_rate=0.0, throttle_rate=0.0,
+                 deleted_rate=0.0, seed=1):
+        self.users = users
+        self.dynamics = dynamics
+        self.max_pics = max_pics
+        self.max_comments = max_comments
+        self.reply_pic_rate = reply_pic_rate
+        self.image_kb = image_kb
+        self.api_latency = api_latency
+        self.image_latency = image_latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.deleted_rate = deleted_rate
+        self.seed = seed
+
+    def uids(self):
+        return [str(100000 + index) for index in range(self.users)]
+
+    def to_args(self):
+        args = []
+        for name, value in vars(self).items():
+            args += [f"--{name.replace('_', '-')}", str(value)]
+        return args
+
+class MockData:
+    """按 (UID, 序号) 确定性地生成动态、评论与图片, 不在内存中保存整个数据集"""
+    def __init__(self, options: MockOptions):
+        self.options = options
+        self.uids = options.uids()
+        # 所有图片共用一段随机字节, 按各自长度截取
+        self.blob = random.Random(options.seed).randbytes(options.image_kb * 1024 * 2)
+
+    def dynamic_id(self, uid, index):
+        return (int(uid) * 10 ** 9) + (self.options.dynamics - index)
+
+    def locate(self, dynamic_id):
+        """由动态 id 反查 (uid, index), 不存在时为 None"""
+        uid, rest = divmod(int(dynamic_id), 10 ** 9)
+        index = self.options.dynamics - rest
+        if str(uid) not in self.uids or not 0 <= index < self.options.dynamics:
+            return None
+        return str(uid), index
+
+    def _rng(self, *parts):
+        return random.Random(f"{self.options.seed}:" + ":".join(map(str, parts)))
+
+    def dynamic(self, uid, index):
+        dynamic_id = self.dynamic_id(uid, index)
+        rng = self._rng("dynamic", dynamic_id)
+        pictures = [self.picture("dyn", dynamic_id, n) for n in range(rng.randint(0, self.options.max_pics))]
+        return {
+            "id": dynamic_id,
+            "rid": dynamic_id + 5 * 10 ** 15,
+            "timestamp": NEWEST_TS - index * DYNAMIC_INTERVAL,
+            "text": f"模拟动态 {uid} #{index}",
+            "pictures": pictures,
+            "comments": rng.randint(0, self.options.max_comments),
+            "deleted": rng.random() < self.options.deleted_rate,
+        }
+
+    def picture(self, *parts):
+        digest = hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()
+        return {
+            "img_src": f"https://i0.hdslb.com/bfs/new_dyn/{digest}.jpg",
+            "img_width": 1920,
+            "img_height": 1080,
+            "img_size": self.image_size(digest) / 1024,
+        }
+
+    def image_size(self, digest):
+        """图片大小在 image_kb 的 0.5 ~ 1.5 倍之间, 由文件名决定"""
+        size_kb = int(digest[:4], 16) % max(self.options.image_kb, 1) + self.options.image_kb // 2
+        return max(1, size_kb) * 1024
+
+    def space_history_card(self, uid, index):
+        dynamic = self.dynamic(uid, index)
+        card = {"item": {"description": dynamic["text"], "pictures": dynamic["pictures"]}}
+        return {
+            "desc": {
+                "dynamic_id": dynamic["id"],
+                "dynamic_id_str": str(dynamic["id"]),
+                "timestamp": dynamic["timestamp"],
+                "type": 2,
+                "rid": dynamic["rid"],
+                "comment": dynamic["comments"],
+            },
+            "card": json.dumps(card, ensure_ascii=False),
+            "extra": {"is_space_top": 0},
+        }
+
+    def polymer_item(self, uid, index):
+        dynamic = self.dynamic(uid, index)
+        items = [
+            {"src": pic["img_src"], "width": pic["img_width"], "height": pic["img_height"], "size": pic["img_size"]}
+            for pic in dynamic["pictures"]
+        ]
+        return {
+            "id_str": str(dynamic["id"]),
+            "type": "DYNAMIC_TYPE_DRAW",
+            "basic": {"comment_id_str": str(dynamic["rid"]), "comment_type": 11},
+            "modules": {
+                "module_author": {"pub_ts": dynamic["timestamp"], "mid": int(uid)},
+                "module_dynamic": {
+                    "desc": {"text": dynamic["text"]},
+                    "major": {"draw": {"id": dynamic["rid"], "items": items}},
+                },
+                "module_stat": {"comment": {"count": dynamic["comments"]}},
+            },
+        }
+
+    def replies(self, oid, page):
+        """第 page 页评论 (按时间从新到旧), 返回 (replies, is_end)"""
+        dynamic_id = int(oid) - 5 * 10 ** 15
+        located = self.locate(dynamic_id)
+        if located is None:
+            return [], True
+        count = self.dynamic(*located)["comments"]
+        start = page * REPLY_PAGE_SIZE
+        replies = []
+        for n in range(start, min(start + REPLY_PAGE_SIZE, count)):
+            rng = self._rng("reply", oid, n)
+            content = {"message": f"评论 {n}"}
+            if rng.random() < self.options.reply_pic_rate:
+                content["pictures"] = [self.picture("reply", oid, n)]
+            replies.append({"rpid": int(oid) * 1000 + (count - n), "content": content, "replies": []})
+        return replies, start + REPLY_PAGE_SIZE >= count
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    data: MockData = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        options = self.data.options
+        parts = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        is_image = parts.path.startswith("/bfs/")
+        time.sleep(options.image_latency if is_image else options.api_latency)
+
+        if random.random() < options.throttle_rate:
+            return self._send(412, b"", "text/plain")
+        if random.random() < options.error_rate:
+            return self._send(500, b"", "text/plain")
+        if is_image:
+            return self._image(parts.path, head)
+
+        routes = {
+            "/dynamic_svr/v1/dynamic_svr/space_history": self._space_history,
+            "/x/polymer/web-dynamic/v1/feed/space": self._feed_space,
+            "/x/polymer/web-dynamic/v1/detail": self._detail,
+            "/x/v2/reply/main": self._reply,
+            "/x/space/acc/info": self._acc_info,
+        }
+        route = routes.get(parts.path)
+        if route is None:
+            return self._json({"code": -404, "message": "啥都木有"}, status=404)
+        return self._json(route(query))
+
+    def _space_history(self, query):
+        uid = query.get("host_uid", "")
+        if uid not in self.data.uids:
+            return {"code": 0, "data": {"has_more": 0, "cards": []}}
+        offset = int(query.get("offset_dynamic_id") or 0)
+        start = self.data.locate(offset)[1] + 1 if offset and self.data.locate(offset) else 0
+        end = min(start + PAGE_SIZE, self.data.options.dynamics)
+        cards = [self.data.space_history_card(uid, index) for index in range(start, end)]
+        has_more = end < self.data.options.dynamics
+        return {"code": 0, "data": {
+            "has_more": int(has_more),
+            "next_offset": self.data.dynamic_id(uid, end - 1) if cards else 0,
+            "cards": cards,
+        }}
+
+    def _feed_space(self, query):
+        uid = query.get("host_mid", "")
+        if uid not in self.data.uids:
+            return {"code": -404, "message": "用户不存在"}
+        offset = query.get("offset") or ""
+        start = self.data.locate(offset)[1] + 1 if offset and self.data.locate(offset) else 0
+        end = min(start + PAGE_SIZE, self.data.options.dynamics)
+        items = [self.data.polymer_item(uid, index) for index in range(start, end)]
+        return {"code": 0, "data": {
+            "has_more": end < self.data.options.dynamics,
+            "offset": str(self.data.dynamic_id(uid, end - 1)) if items else "",
+            "items": items,
+        }}
+
+    def _detail(self, query):
+        located = self.data.locate(query.get("id") or 0)
+        if located is None or self.data.dynamic(*located)["deleted"]:
+            return {"code": 4101131, "message": "内容不存在"}
+        return {"code": 0, "data": {"item": self.data.polymer_item(*located)}}
+
+    def _reply(self, query):
+        page = int(query.get("next") or 0)
+        replies, is_end = self.data.replies(query.get("oid", "0"), page)
+        return {"code": 0, "data": {"cursor": {"is_end": is_end, "next": page + 1}, "replies": replies}}
+
+    def _acc_info(self, query):
+        mid = query.get("mid", "")
+        return {"code": 0, "data": {"mid": int(mid or 0), "name": f"mock_{mid}", "face": ""}}
+
+    def _image(self, path, head):
+        match = IMAGE_PATTERN.match(path)
+        if not match:
+            return self._send(404, b"", "text/plain")
+        digest, _, variant = match.groups()
+        size = self.data.image_size(digest)
+        if variant:
+            # 缩小版约为原图的四分之一
+            size = max(1024, size // 4)
+        offset = int(digest[4:8], 16) % (len(self.data.blob) - size)
+        body = self.data.blob[offset:offset + size]
+
+        range_header = self.headers.get("Range", "")
+        match = re.match(r"bytes=(\d+)-$", range_header)
+        if match and int(match.group(1)) < size:
+            start = int(match.group(1))
+            return self._send(206, body[start:], "image/jpeg", head,
+                              {"Content-Range": f"bytes {start}-{size - 1}/{size}"})
+        if match:
+            return self._send(416, b"", "text/plain")
+        return self._send(200, body, "image/jpeg", head)
+
+    def _json(self, payload, status=200):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json")
+
+    def _send(self, status, body, content_type, head=False, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+def serve(options: MockOptions, port=0):
+    """在当前进程中启动服务器, 返回 ThreadingHTTPServer (需调用 serve_forever)"""
+    handler = type("BoundMockHandler", (MockHandler,), {"data": MockData(options)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    return server
+
+def start_subprocess(options: MockOptions):
+    """
+    在子进程中启动服务器, 避免与被测爬虫争用 GIL
+    :return: (Popen, base_url)
+    """
+    process = subprocess.Popen(
+        [sys.executable, __file__, "--port", "0"] + options.to_args(),
+        stdout=subprocess.PIPE, text=True
+    )
+    base_url = process.stdout.readline().strip()
+    return process, base_url
+
+def parse_options(argv=None):
+    parser = argparse.ArgumentParser(description="本地模拟B站接口与图片服务器")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口, 0 表示随机")
+    defaults = MockOptions()
+    for name, value in vars(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args(argv)
+    options = MockOptions(**{name: getattr(args, name) for name in vars(defaults)})
+    return args.port, options
+
+def main():
+    port, options = parse_options()
+    server = serve(options, port)
+    # 第一行输出服务地址, 供 start_subprocess 读取
+    print(f"http://127.0.0.1:{server.server_address[1]}", flush=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
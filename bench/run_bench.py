@@ -0,0 +1,140 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bili_comment
+import bili_dynamic
+from bili_state import STATUS_SAVED
+from mock_server import parse_options, start_subprocess
+
+# 不限速时各接口使用的 [初始速率, 最大速率]
+UNLIMITED = [1000.0, 1000.0]
+ENDPOINTS = ("feed", "detail", "reply", "user_info", "image")
+
+def transfer_stats(metrics):
+    histogram = metrics.stages.get("transfer.image")
+    return (histogram.count if histogram else 0), metrics.bytes.get("transfer.image", 0)
+
+def bench_dynamic(base_url, options, work_dir, rate_limits, settings_override, report_dir, combined=False):
+    name = "bili_combined" if combined else "bili_dynamic"
+    settings = {
+        "COOKIE": "x" * 120,
+        "default_uid": [f"mock_{uid}" for uid in options.uids()],
+        "interval": 0,
+        "base_dir": os.path.join(work_dir, name),
+        "BASE_URL": base_url,
+        "RATE_LIMITS": rate_limits,
+    }
+    settings.update(settings_override)
+    config = bili_dynamic.Config(settings)
+    downloader = bili_dynamic.Downloader(config)
+    start = time.monotonic()
+    try:
+        if combined:
+            scheduler = bili_dynamic.CrawlScheduler.combined(config, downloader, "url")
+        else:
+            scheduler = bili_dynamic.CrawlScheduler(config, downloader, "url")
+        scheduler.run(config.uid_list)
+        downloader.close()
+        elapsed = time.monotonic() - start
+        config.state.flush()
+        dynamics = config.state.count_status(config.uid_list, STATUS_SAVED)
+        images, size = transfer_stats(config.http.metrics)
+        if report_dir:
+            config.http.metrics.write_report(report_dir, name)
+    finally:
+        config.http.close()
+        config.state.close()
+        config.catalog.close()
+    return {"dynamics": dynamics, "images": images, "bytes": size, "elapsed": elapsed}
+
+def bench_comment(base_url, options, work_dir, rate_limits, report_dir):
+    Config = bili_comment.Config
+    Config.USER_MID = options.uids()[0]
+    Config.COOKIE = "x" * 120
+    Config.SAVE_PATH = os.path.join(work_dir, "comment")
+    Config.BASE_URL = base_url
+    Config.RATE_LIMITS = rate_limits
+    Config.WRITE_REPORT = False
+    os.makedirs(Config.SAVE_PATH, exist_ok=True)
+    controller = bili_comment.MainController()
+    start = time.monotonic()
+    try:
+        controller.process_all_dynamics()
+        elapsed = time.monotonic() - start
+        images, size = transfer_stats(controller.http.metrics)
+        if report_dir:
+            controller.http.metrics.write_report(report_dir, "bili_comment")
+    finally:
+        controller.http.close()
+        controller.state.close()
+    return {"dynamics": controller.progress.dynamics, "images": images, "bytes": size, "elapsed": elapsed}
+
+def summarize(name, result):
+    elapsed = max(result["elapsed"], 1e-6)
+    return {
+        "crawler": name,
+        "elapsed": round(elapsed, 3),
+        "dynamics": result["dynamics"],
+        "images": result["images"],
+        "mb": round(result["bytes"] / 1024 / 1024, 2),
+        "dynamics_per_sec": round(result["dynamics"] / elapsed, 2),
+        "images_per_sec": round(result["images"] / elapsed, 2),
+        "mb_per_sec": round(result["bytes"] / 1024 / 1024 / elapsed, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="在本地模拟服务器上端到端运行 bili_dynamic 与 bili_comment, 输出吞吐量",
+        epilog="其余参数 (如 --users 5 --api-latency 0.1 --throttle-rate 0.02) 传给模拟服务器"
+    )
+    parser.add_argument("--crawler", choices=("dynamic", "comment", "combined", "all"), default="all",
+                        help="combined 为 bili_dynamic 的合并抓取 (动态图片 + 所有用户的评论区图片)")
+    parser.add_argument("--no-limit", action="store_true", help="放开限速器, 只测量代码本身的开销")
+    parser.add_argument("--setting", action="append", default=[], metavar="KEY=JSON",
+                        help="覆盖 bili_dynamic 的配置项, 如 --setting UID_WORKERS=1")
+    parser.add_argument("--json", metavar="PATH", help="把结果写入 JSON 文件, 便于不同版本之间对比")
+    parser.add_argument("--report-dir", help="同时把两个爬虫的详细运行报告写入该目录")
+    parser.add_argument("--verbose", action="store_true", help="显示爬虫自身的输出")
+    args, server_argv = parser.parse_known_args()
+    _, options = parse_options(server_argv)
+
+    rate_limits = {endpoint: UNLIMITED for endpoint in ENDPOINTS} if args.no_limit else {}
+    settings_override = {}
+    for item in args.setting:
+        key, _, value = item.partition("=")
+        settings_override[key] = json.loads(value)
+
+    server, base_url = start_subprocess(options)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="bili_bench_") as work_dir:
+            output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+            with output:
+                if args.crawler in ("dynamic", "all"):
+                    results.append(summarize("bili_dynamic", bench_dynamic(base_url, options, work_dir, rate_limits, settings_override, args.report_dir)))
+                if args.crawler in ("comment", "all"):
+                    results.append(summarize("bili_comment", bench_comment(base_url, options, work_dir, rate_limits, args.report_dir)))
+                if args.crawler in ("combined", "all"):
+                    results.append(summarize("bili_combined", bench_dynamic(base_url, options, work_dir, rate_limits, settings_override, args.report_dir, combined=True)))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"模拟服务器: {vars(options)}")
+    print(f"{'爬虫':<14}{'耗时(s)':>10}{'动态':>8}{'图片':>8}{'MB':>9}{'动态/s':>10}{'图片/s':>10}{'MB/s':>9}")
+    for result in results:
+        print(f"{result['crawler']:<14}{result['elapsed']:>10.2f}{result['dynamics']:>8}{result['images']:>8}"
+              f"{result['mb']:>9.2f}{result['dynamics_per_sec']:>10.2f}{result['images_per_sec']:>10.2f}{result['mb_per_sec']:>9.2f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"options": vars(options), "no_limit": args.no_limit, "results": results}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+from urllib.parse import urlsplit
+
+# hdslb 图片地址的文件名就是内容哈希, 如 /bfs/new_dyn/0a1b...9f.jpg, 缩小版带有 @1080w_75q.webp 之类的参数
+HDSLB_HASH_PATTERN = re.compile(r"/([0-9a-f]{32,64})\.\w+(?:@(\w+)(?:\.\w+)?)?$")
+
+class BlobStore:
+    """
+    按内容寻址的图片仓库: 同一张图片只下载、存储一次, 其余位置通过硬链接引用
+    键优先取 hdslb 地址中的哈希, 取不到时下载后计算内容的 sha1
+    """
+    def __init__(self, root, mode="link"):
+        """
+        :param root: 仓库目录, 须与图片保存目录位于同一磁盘才能使用硬链接
+        :param mode: "link" 硬链接 (不支持时复制), "copy" 始终复制
+        """
+        self.root = root
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.hits = 0
+        self.saved_requests = 0
+        self.saved_bytes = 0
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+
+    @staticmethod
+    def url_key(url):
+        match = HDSLB_HASH_PATTERN.search(urlsplit(url).path)
+        if not match:
+            return None
+        # 同一张图的不同缩小版各自存储, 格式由 blob 的扩展名区分
+        return f"{match.group(1)}_{match.group(2)}" if match.group(2) else match.group(1)
+
+    def blob_path(self, key, ext):
+        return os.path.join(self.root, key[:2], key + ext)
+
+    def _key_lock(self, key):
+        with self.lock:
+            if key not in self.key_locks:
+                self.key_locks[key] = threading.Lock()
+            return self.key_locks[key]
+
+    def _place(self, blob, target):
+        if os.path.exists(target):
+            if os.path.samefile(blob, target):
+                return
+            os.remove(target)
+        if self.mode == "link":
+            try:
+                os.link(blob, target)
+                return
+            except OSError:
+                pass
+        shutil.copyfile(blob, target)
+
+    def _record_hit(self, blob, request_saved):
+        with self.lock:
+            self.hits += 1
+            self.saved_bytes += os.path.getsize(blob)
+            if request_saved:
+                self.saved_requests += 1
+
+    def fetch(self, url, target, download):
+        """
+        把 url 对应的图片放到 target, 仓库中已有时直接引用
+        :param download: 实际下载函数 download(url, filepath) -> 是否成功
+        :return: 是否成功
+        """
+        ext = os.path.splitext(target)[1] or os.path.splitext(urlsplit(url).path)[1]
+        key = self.url_key(url)
+        with self._key_lock(key or url):
+            if key:
+                blob = self.blob_path(key, ext)
+                if os.path.exists(blob):
+                    self._place(blob, target)
+                    self._record_hit(blob, request_saved=True)
+                    return True
+            return self._download_blob(url, target, download, key, ext)
+
+    def _download_blob(self, url, target, download, key, ext):
+        # 临时文件名固定, 中断后下次可以续传
+        tmp_name = key or hashlib.sha1(url.encode("utf-8")).hexdigest()
+        tmp_path = os.path.join(self.root, "tmp", tmp_name + ext)
+        try:
+            if not download(url, tmp_path):
+                return False
+            if key is None:
+                key = _sha1_of_file(tmp_path)
+                blob = self.blob_path(key, ext)
+                with self._key_lock(key):
+                    if os.path.exists(blob):
+                        self._place(blob, target)
+                        self._record_hit(blob, request_saved=False)
+                        return True
+                    return self._store(tmp_path, blob, target)
+            return self._store(tmp_path, self.blob_path(key, ext), target)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _store(self, tmp_path, blob, target):
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        os.replace(tmp_path, blob)
+        self._place(blob, target)
+        return True
+
+    def print_stats(self):
+        if not self.hits:
+            return
+        print(f"图片去重: 复用 {self.hits} 张, 省去 {self.saved_requests} 次下载, "
+              f"节省 {self.saved_bytes / 1024 / 1024:.1f} MB")
+
+def _sha1_of_file(filepath):
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
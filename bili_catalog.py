@@ -0,0 +1,287 @@
+import argparse
+import datetime
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog (
+    id INTEGER PRIMARY KEY,
+    dynamic_id TEXT NOT NULL UNIQUE,
+    uid TEXT NOT NULL,
+    timestamp INTEGER,
+    text TEXT NOT NULL DEFAULT '',
+    path TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_catalog_time ON catalog (timestamp);
+CREATE INDEX IF NOT EXISTS idx_catalog_uid_time ON catalog (uid, timestamp);
+CREATE TABLE IF NOT EXISTS catalog_images (
+    dynamic_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    PRIMARY KEY (dynamic_id, path)
+);
+CREATE TRIGGER IF NOT EXISTS catalog_ai AFTER INSERT ON catalog BEGIN
+    INSERT INTO catalog_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS catalog_ad AFTER DELETE ON catalog BEGIN
+    INSERT INTO catalog_fts (catalog_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS catalog_au AFTER UPDATE ON catalog BEGIN
+    INSERT INTO catalog_fts (catalog_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO catalog_fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+# trigram 分词 (SQLite 3.34+) 按任意三个字符建索引, 中文不需要分词也能做子串搜索
+FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS catalog_fts USING fts5(text, content='catalog', content_rowid='id', tokenize='{}')"
+
+# 用户目录 "用户名_UID" 与 info.txt 中的字段, 格式见 DynamicProcessor
+USER_DIR_PATTERN = re.compile(r"_(\d+)$")
+INFO_PATTERN = re.compile(r"^URL: \S*?/(\d+)\n发布时间: (\d+)-(\d+)-(\d+)-(\d+)-(\d+)\n内容:\n", re.S)
+SKIP_FILES = {"info.txt"}
+SKIP_SUFFIXES = (".part", ".post")
+
+class Catalog:
+    """
+    已保存动态的本地目录: ID、UID、发布时间、正文、info.txt 路径与图片路径/大小, 正文带 FTS5 全文索引
+    与状态库一样先缓存写入, 由调用方按页 flush; 路径均为相对于 base_dir 的路径
+    """
+    def __init__(self, db_path, base_dir):
+        self.db_path = db_path
+        self.base_dir = base_dir
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            self.conn.execute(FTS_SCHEMA.format("trigram"))
+        except sqlite3.OperationalError:
+            # 旧版 SQLite 没有 trigram, 退回 unicode61, 此时中文搜索全部走 LIKE
+            self.conn.execute(FTS_SCHEMA.format("unicode61"))
+        self.conn.executescript(SCHEMA)
+        row = self.conn.execute("SELECT sql FROM sqlite_master WHERE name = 'catalog_fts'").fetchone()
+        self.trigram = "trigram" in row[0]
+        self.lock = threading.RLock()
+        self.pending = {}
+
+    def _relpath(self, path):
+        return os.path.relpath(path, self.base_dir) if path else None
+
+    def add(self, uid, dynamic_id, timestamp, text, path, images=()):
+        """
+        :param path: 动态的 info.txt (无图动态为 txt 目录下的文本文件) 完整路径
+        :param images: 图片的完整路径, 文件已存在时记录大小
+        """
+        image_rows = [
+            (self._relpath(image), os.path.getsize(image) if os.path.isfile(image) else None)
+            for image in images
+        ]
+        with self.lock:
+            self.pending[str(dynamic_id)] = (str(uid), timestamp, text or "", self._relpath(path), image_rows)
+
+    def add_folder(self, uid, dynamic_id, timestamp, info_path, known_sizes=None):
+        """
+        按 info.txt 所在文件夹登记一条动态, 用于合并计划模式的完成记录:
+        正文取自 info.txt, 图片为文件夹中已有的文件加上 known_sizes 中 (可能下载在其他主机上的) 图片
+        :param known_sizes: {图片完整路径: 大小}
+        """
+        parsed = _parse_info(info_path)
+        folder = os.path.dirname(info_path)
+        names = os.listdir(folder) if os.path.isdir(folder) else []
+        sizes = {
+            image: os.path.getsize(image)
+            for image in _image_files(folder, names) if os.path.isfile(image)
+        }
+        sizes.update(known_sizes or {})
+        image_rows = [(self._relpath(image), size) for image, size in sorted(sizes.items())]
+        text = parsed[2] if parsed else ""
+        with self.lock:
+            self.pending[str(dynamic_id)] = (str(uid), timestamp, text, self._relpath(info_path), image_rows)
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            with self.conn:
+                self._write(self.pending)
+            self.pending.clear()
+
+    def _write(self, entries):
+        self.conn.executemany(
+            "INSERT INTO catalog (dynamic_id, uid, timestamp, text, path) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (dynamic_id) DO UPDATE SET uid = excluded.uid, timestamp = excluded.timestamp, "
+            "text = excluded.text, path = excluded.path",
+            [(dynamic_id, uid, timestamp, text, path) for dynamic_id, (uid, timestamp, text, path, _) in entries.items()]
+        )
+        self.conn.executemany("DELETE FROM catalog_images WHERE dynamic_id = ?", [(dynamic_id,) for dynamic_id in entries])
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO catalog_images (dynamic_id, path, size) VALUES (?, ?, ?)",
+            [(dynamic_id, image, size) for dynamic_id, entry in entries.items() for image, size in entry[4]]
+        )
+
+    def search(self, query="", uid=None, since=None, until=None, with_images=False, limit=50):
+        """
+        :param query: 空格分隔的关键词, 全部包含才匹配; 三个字符及以上的走 FTS5 索引, 更短的用 LIKE
+        :param since: 发布时间下限 (时间戳, 含)
+        :param until: 发布时间上限 (时间戳, 不含)
+        :param with_images: 只返回有图片的动态
+        :return: [{"dynamic_id", "uid", "timestamp", "text", "path", "images": [(path, size)]}], 按发布时间从新到旧
+        """
+        conditions, params = [], []
+        fts_terms = []
+        for term in query.split():
+            if self.trigram and len(term) >= 3:
+                fts_terms.append('"' + term.replace('"', '""') + '"')
+            else:
+                conditions.append("c.text LIKE ? ESCAPE '\\'")
+                params.append("%" + re.sub(r"([%_\\])", r"\\\1", term) + "%")
+        if fts_terms:
+            conditions.append("c.id IN (SELECT rowid FROM catalog_fts WHERE catalog_fts MATCH ?)")
+            params.append(" AND ".join(fts_terms))
+        if uid:
+            conditions.append("c.uid = ?")
+            params.append(str(uid))
+        if since is not None:
+            conditions.append("c.timestamp >= ?")
+            params.append(int(since))
+        if until is not None:
+            conditions.append("c.timestamp < ?")
+            params.append(int(until))
+        if with_images:
+            conditions.append("EXISTS (SELECT 1 FROM catalog_images i WHERE i.dynamic_id = c.dynamic_id)")
+        sql = "SELECT c.dynamic_id, c.uid, c.timestamp, c.text, c.path FROM catalog c"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY c.timestamp DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+            results = []
+            for dynamic_id, row_uid, timestamp, text, path in rows:
+                images = self.conn.execute(
+                    "SELECT path, size FROM catalog_images WHERE dynamic_id = ? ORDER BY path", (dynamic_id,)
+                ).fetchall()
+                results.append({"dynamic_id": dynamic_id, "uid": row_uid, "timestamp": timestamp,
+                                "text": text, "path": path, "images": images})
+            return results
+
+    def rebuild(self):
+        """
+        清空目录后从 base_dir 下各用户目录中的 info.txt 与 txt/*.txt 重新导入, 发布时间只精确到分钟
+        :return: 导入的动态数
+        """
+        entries = {}
+        for entry in sorted(os.scandir(self.base_dir), key=lambda entry: entry.name):
+            match = USER_DIR_PATTERN.search(entry.name)
+            if match and entry.is_dir():
+                entries.update(self._scan_user_dir(entry.path, match.group(1)))
+        with self.lock:
+            self.pending.clear()
+            with self.conn:
+                self.conn.execute("DELETE FROM catalog")
+                self.conn.execute("DELETE FROM catalog_images")
+                self.conn.execute("INSERT INTO catalog_fts (catalog_fts) VALUES ('rebuild')")
+                self._write(entries)
+        return len(entries)
+
+    def _scan_user_dir(self, user_dir, uid):
+        entries = {}
+        for folder, dirs, files in os.walk(user_dir):
+            # 评论区图片、缩略图等不属于动态本身
+            dirs[:] = [name for name in dirs if not name.startswith(".") and name != "comments"]
+            if os.path.basename(folder) == "txt" and os.path.dirname(folder) == user_dir:
+                text_files = [name for name in files if name.endswith(".txt")]
+                images = []
+            elif "info.txt" in files:
+                text_files = ["info.txt"]
+                images = _image_files(folder, files)
+            else:
+                continue
+            for name in text_files:
+                path = os.path.join(folder, name)
+                parsed = _parse_info(path)
+                if parsed is None:
+                    continue
+                dynamic_id, timestamp, text = parsed
+                image_rows = [(self._relpath(image), os.path.getsize(image)) for image in images]
+                entries[dynamic_id] = (uid, timestamp, text, self._relpath(path), image_rows)
+        return entries
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+def _image_files(folder, names):
+    """动态文件夹中的图片: 除 info.txt 与未完成的临时文件外的所有文件"""
+    return sorted(
+        os.path.join(folder, name) for name in names
+        if name not in SKIP_FILES and not name.endswith(SKIP_SUFFIXES) and not name.startswith(".")
+    )
+
+def _parse_info(path):
+    """
+    解析 info.txt: "URL: ...\\n发布时间: Y-M-D-HH-MM\\n内容:\\n正文"
+    :return: (dynamic_id, timestamp, text), 格式不符时为 None
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+    match = INFO_PATTERN.match(content)
+    if not match:
+        return None
+    year, month, day, hour, minute = map(int, match.groups()[1:])
+    timestamp = int(datetime.datetime(year, month, day, hour, minute).timestamp())
+    return match.group(1), timestamp, content[match.end():]
+
+def _parse_date(text):
+    return datetime.datetime.strptime(text, "%Y-%m-%d").timestamp()
+
+def main():
+    parser = argparse.ArgumentParser(description="查询已保存动态的本地目录")
+    parser.add_argument("--base-dir", help="保存基目录, 默认取 config.json 中的 base_dir")
+    commands = parser.add_subparsers(dest="command", required=True)
+    search = commands.add_parser("search", help="按关键词、用户与发布时间查询")
+    search.add_argument("query", nargs="*", help="关键词, 多个关键词须全部包含")
+    search.add_argument("--uid", help="只查这个用户")
+    search.add_argument("--since", type=_parse_date, metavar="YYYY-MM-DD", help="发布日期不早于")
+    search.add_argument("--until", type=_parse_date, metavar="YYYY-MM-DD", help="发布日期早于")
+    search.add_argument("--images", action="store_true", help="只列出有图片的动态, 并列出图片路径")
+    search.add_argument("--limit", type=int, default=50, help="最多返回条数, 0 表示不限")
+    commands.add_parser("rebuild", help="清空目录, 从已保存的 info.txt 与 txt/*.txt 重新导入")
+    args = parser.parse_args()
+
+    base_dir = args.base_dir
+    if not base_dir:
+        with open("config.json", 'r', encoding='utf-8') as f:
+            base_dir = json.load(f)["base_dir"]
+    if not os.path.isdir(base_dir):
+        print(f"保存基目录不存在: {base_dir}")
+        return
+    catalog = Catalog(os.path.join(base_dir, "catalog.db"), base_dir)
+    try:
+        start = time.perf_counter()
+        if args.command == "rebuild":
+            count = catalog.rebuild()
+            print(f"已导入 {count} 条动态, 耗时 {time.perf_counter() - start:.1f} 秒")
+            return
+        results = catalog.search(" ".join(args.query), args.uid, args.since, args.until, args.images, args.limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for result in results:
+            published = datetime.datetime.fromtimestamp(result["timestamp"]).strftime("%Y-%m-%d %H:%M") if result["timestamp"] else "-"
+            text = " ".join(result["text"].split())
+            print(f"{published}  UID {result['uid']}  https://t.bilibili.com/{result['dynamic_id']}  {text[:60]}")
+            if args.images:
+                for path, size in result["images"]:
+                    print(f"    {path}" + (f"  ({size / 1024:.0f} KB)" if size else ""))
+        print(f"共 {len(results)} 条, 查询耗时 {elapsed_ms:.1f} 毫秒")
+    finally:
+        catalog.close()
+
+if __name__ == "__main__":
+    main()
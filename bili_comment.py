@@ -1,56 +1,82 @@
 import os
-import requests
-import json
-import random
+import argparse
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from bili_blobstore import BlobStore
+from bili_http import HttpClient
+from bili_metrics import profiled
+from bili_model import Dynamic
+from bili_postprocess import PostProcessor
+from bili_ratelimit import RISK_CONTROL_CODES, RateLimiter
+from bili_retry import RetryPolicy
+from bili_state import StateStore
+from bili_variant import VariantSelector, local_filename
 #当动态的评论区没有图片的时候，不创建文件夹
 class Config:
     """全局配置类"""
     USER_MID = "560647"  # 默认用户UID
     COOKIE = ""
-    HEADERS = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Referer": "https://www.bilibili.com/",
-        "Cookie": COOKIE
-    }
+    HTTP_POOL_SIZE = 10  # 每个主机保留的 keep-alive 连接数
     SAVE_PATH = "C:\\Base1\\bbb\\bili_comment"
-    DELAY_RANGE = (0.5, 0.6)  # 随机延迟范围
-    DYNAMIC_TYPE_MAP = {
-        "DYNAMIC_TYPE_DRAW": 11,
-        "DYNAMIC_TYPE_WORD": 17,
-        "DYNAMIC_TYPE_FORWARD": 17
-    }
+    DOWNLOAD_CHUNK_SIZE = 65536  # 下载写盘的缓冲块大小 (字节)
+    IMAGE_DEDUP = "link"  # 重复图片: "link" 硬链接到内容仓库, "copy" 复制, "off" 关闭去重
+    IMAGE_VARIANT = {}  # 评论图片下载 CDN 缩小版, 如 {"max_width": 1080, "quality": 80}, 为空时下载原图
+    POSTPROCESS_WORKERS = 0  # 图片后处理进程数 (需要 Pillow), 0 表示关闭
+    THUMBNAIL_SIZE = 0  # 缩略图最长边 (像素), 0 表示不生成
+    RECOMPRESS_PNG_KB = 0  # 大于这个大小 (KB) 的 PNG 做无损重压缩, 0 表示不处理
+    STRIP_METADATA = False  # 是否去除图片中的 EXIF 等元数据
+    RATE_LIMITS = {}  # 覆盖默认限速 [初始速率, 最大速率], 如 {"reply": [2.0, 6.0]}
+    DYNAMIC_WORKERS = 4  # 同时抓取评论区的动态数量
+    PROGRESS_EVERY = 10  # 每处理多少条动态输出一次进度
+    IMAGE_WORKERS = 4  # 图片下载线程数
+    IMAGE_QUEUE_SIZE = 32  # 等待下载的图片上限, 超出时暂停翻评论页
+    REPLY_PAGE_SIZE = 20  # reply/main 每页的评论数, 用于按评论数估算翻页深度
+    MAX_REPLY_PAGES = 0  # 每条动态最多翻的评论页数, 0 表示只按评论数估算
+    FREEZE_DAYS = 365  # 发布超过这么多天且抓取过的动态不再重新抓取评论, 0 表示不冻结
+    RETRY_MAX_ATTEMPTS = 5  # 动态列表连续请求失败多少次后放弃
+    RETRY_BASE_DELAY = 5  # 动态列表请求失败后的首次等待秒数, 之后每次翻倍
+    WRITE_REPORT = True  # 结束时把运行报告 (JSON) 写入 SAVE_PATH/reports
+    PROFILE_PATH = ""  # 不为空时用 cProfile 分析主线程并写入该文件
+    BASE_URL = ""  # 不为空时把B站接口与图片请求改发到这个地址, 如本地模拟服务器
+
+    @classmethod
+    def update(cls, overrides):
+        """用 dict 覆盖同名配置项, 供 bili_dynamic 的合并抓取使用"""
+        for key, value in (overrides or {}).items():
+            if not hasattr(cls, key):
+                print(f"未知的评论区配置项: {key}")
+                continue
+            setattr(cls, key, value)
 
 class APIClient:
     """API请求客户端"""
-    def __init__(self):
-        self.headers = Config.HEADERS
-        self.delay_range = Config.DELAY_RANGE
-    
-    def _random_delay(self):
-        """生成随机延迟"""
-        time.sleep(random.uniform(*self.delay_range))
+    def __init__(self, http):
+        self.http = http
     
     def fetch_dynamic_page(self, offset):
         """
         获取单页动态数据
         :param offset: 分页偏移量
-        :return: (has_more, next_offset, items)
+        :return: (has_more, next_offset, items), 请求失败或触发风控等可重试的错误时 has_more 为 None
         """
-        self._random_delay()
+        with self.http.metrics.timer("api.feed_page"):
+            return self._fetch_dynamic_page(offset)
+
+    def _fetch_dynamic_page(self, offset):
         try:
-            response = requests.get(
+            data = self.http.get_json(
                 url="https://api.bilibili.com/x/polymer/web-dynamic/v1/feed/space",
-                headers=self.headers,
+                endpoint="feed",
                 params={"host_mid": Config.USER_MID, "offset": offset},
                 timeout=15
             )
-            response.raise_for_status()
-            data = json.loads(response.text)
             
             if data["code"] != 0:
                 print(f"动态接口错误: {data['message']}")
+                if data["code"] in RISK_CONTROL_CODES:
+                    return None, None, []
                 return False, None, []
             
             return (
@@ -60,31 +86,33 @@ class APIClient:
             )
         except Exception as e:
             print(f"动态页请求失败: {str(e)}")
-            return False, None, []
+            return None, None, []
     
-    def fetch_comments(self, oid, dynamic_type, next_page=0):
+    def fetch_comments(self, oid, dynamic_type, next_page=0, mode=3):
         """
         获取评论数据
         :param oid: 动态ID
         :param dynamic_type: 动态类型
         :param next_page: 分页页码
-        :return: (is_end, next_page, replies)
+        :param mode: 3 按热度, 2 按时间从新到旧
+        :return: (is_end, next_page, replies), 请求失败时 is_end 为 None
         """
-        self._random_delay()
+        with self.http.metrics.timer("api.comments"):
+            return self._fetch_comments(oid, dynamic_type, next_page, mode)
+
+    def _fetch_comments(self, oid, dynamic_type, next_page, mode):
         try:
-            response = requests.get(
+            data = self.http.get_json(
                 url="https://api.bilibili.com/x/v2/reply/main",
-                headers=self.headers,
+                endpoint="reply",
                 params={
                     "type": dynamic_type,
                     "oid": oid,
-                    "mode": 3,
+                    "mode": mode,
                     "next": next_page
                 },
                 timeout=10
             )
-            response.raise_for_status()
-            data = json.loads(response.text)
             
             if data["code"] != 0:
                 print(f"评论接口错误: {data['message']}")
@@ -93,11 +121,11 @@ class APIClient:
             return (
                 data["data"]["cursor"]["is_end"],
                 data["data"]["cursor"]["next"],
-                data["data"]["replies"]
+                data["data"]["replies"] or []
             )
         except Exception as e:
             print(f"评论请求失败: {str(e)}")
-            return True, 0, []
+            return None, 0, []
 
 class DynamicProcessor:
     """动态处理器"""
@@ -107,161 +135,383 @@ class DynamicProcessor:
     def parse_dynamic_item(self, item):
         """
         解析单个动态项
-        :return: (oid, pub_date, dynamic_type)
+        :return: Dynamic, 缺少评论区信息时为 None
         """
-        try:
-            dynamic_type = Config.DYNAMIC_TYPE_MAP.get(item["type"], 17)
-            if dynamic_type == 11:
-                oid = item["modules"]["module_dynamic"]["major"]["draw"]["id"]
-            else:
-                oid = item["id_str"]
-            
-            pub_date = datetime.fromtimestamp(
-                item["modules"]["module_author"]["pub_ts"]
-            )
-            return oid, pub_date, dynamic_type
-        except KeyError as e:
-            print(f"动态解析失败: {str(e)}")
-            return None, None, None
+        dynamic = Dynamic.from_feed_space(item)
+        if not dynamic.comment_oid or not dynamic.timestamp:
+            print(f"动态解析失败: {item.get('id_str')}")
+            return None
+        return dynamic
 
 class ImageDownloader:
     """图片下载器"""
-    def __init__(self):
-        self.base_path = Config.SAVE_PATH
+    def __init__(self, http, state, base_path=None, shared=None):
+        """
+        :param base_path: 默认的保存目录, 为空时使用 Config.SAVE_PATH
+        :param shared: 提供 blobs / variants / postprocess 的下载器 (如 bili_dynamic.Downloader), 给出时与它共用
+        """
+        self.http = http
+        self.base_path = base_path or Config.SAVE_PATH
+        self.skipped = 0
+        self.lock = threading.Lock()
+        if shared is not None:
+            self.blobs = shared.blobs
+            self.variants = shared.variants
+            self.postprocess = shared.postprocess
+            return
+        self.blobs = None
+        if Config.IMAGE_DEDUP != "off":
+            self.blobs = BlobStore(os.path.join(self.base_path, ".blobs"), Config.IMAGE_DEDUP)
+        self.variants = VariantSelector({"default": Config.IMAGE_VARIANT})
+        self.postprocess = PostProcessor(
+            state,
+            self.base_path,
+            workers=Config.POSTPROCESS_WORKERS,
+            thumbnail_size=Config.THUMBNAIL_SIZE,
+            recompress_png_kb=Config.RECOMPRESS_PNG_KB,
+            strip_metadata=Config.STRIP_METADATA
+        )
     
-    def create_folder(self, pub_date):
+    def create_folder(self, pub_date, base_path=None):
         """
         创建保存目录
+        :param base_path: 在这个目录下按日期建文件夹, 为空时使用 self.base_path
         :return: 完整保存路径
         """
         folder_name = pub_date.strftime("%Y-%m-%d")
-        full_path = os.path.join(self.base_path, folder_name)
+        full_path = os.path.join(base_path or self.base_path, folder_name)
         os.makedirs(full_path, exist_ok=True)
         return full_path
     
     def download(self, url, save_path, retry=3):
         """
         下载单张图片
-        :return: 是否下载成功
+        :return: 图片是否已在本地 (本次下载成功或早已存在)
         """
-        filename = url.split("/")[-1].split("?")[0]
+        with self.http.metrics.timer("image.download"):
+            try:
+                return self._download(url, save_path, retry)
+            finally:
+                self.variants.discard(url)
+
+    def _download(self, url, save_path, retry):
+        filename = local_filename(url)
         filepath = os.path.join(save_path, filename)
         
+        # 下载经 .part 原子重命名, 已存在的文件必然完整
         if os.path.exists(filepath):
-            return False
+            with self.lock:
+                self.skipped += 1
+            self.postprocess.submit(filepath)
+            return True
         
+        if self.blobs is not None:
+            ok = self.blobs.fetch(url, filepath, lambda url, path: self._fetch(url, path, filename, retry))
+        else:
+            ok = self._fetch(url, filepath, filename, retry)
+        if ok:
+            print(f"下载成功: {filename}")
+            self.postprocess.submit(filepath)
+        return ok
+
+    def _fetch(self, url, filepath, filename, retry):
         for attempt in range(retry):
             try:
-                response = requests.get(url, headers=Config.HEADERS, stream=True, timeout=20)
-                response.raise_for_status()
-                
-                with open(filepath, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                print(f"下载成功: {filename}")
+                # 写入 .part 后原子重命名, 重试时从已下载的位置续传
+                self.http.download(url, filepath, endpoint="image", chunk_size=Config.DOWNLOAD_CHUNK_SIZE, timeout=20)
+                self.variants.record(url, os.path.getsize(filepath))
                 return True
             except Exception as e:
                 print(f"下载失败({attempt+1}/{retry}): {filename}")
+                self.http.metrics.add_sleep("image_retry", 1)
                 time.sleep(1)
         
         print(f"永久下载失败: {filename}")
         return False
 
+class Progress:
+    """抓取进度统计"""
+    def __init__(self):
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+        self.dynamics = 0
+        self.reply_pages = 0
+        self.skipped = 0
+
+    def add(self, dynamics=0, reply_pages=0, skipped=0):
+        with self.lock:
+            self.dynamics += dynamics
+            self.reply_pages += reply_pages
+            self.skipped += skipped
+            return self.dynamics
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        print(f"进度: 动态 {self.dynamics} 条 ({self.dynamics / elapsed:.2f} 条/秒), "
+              f"评论页 {self.reply_pages} 页 ({self.reply_pages / elapsed:.2f} 页/秒), "
+              f"无评论跳过 {self.skipped} 条")
+
 class MainController:
     """主控制器"""
-    def __init__(self):
-        self.api_client = APIClient()
+    def __init__(self, http=None, state=None, downloader=None):
+        """
+        单独运行时三者都自己创建; 由 bili_dynamic 的合并抓取调用时传入共用的 HttpClient、StateStore 与 ImageDownloader
+        """
+        self.http = http or HttpClient(
+            cookie=Config.COOKIE,
+            pool_maxsize=Config.HTTP_POOL_SIZE,
+            limiter=RateLimiter(Config.RATE_LIMITS),
+            base_url=Config.BASE_URL
+        )
+        self.api_client = APIClient(self.http)
         self.dynamic_processor = DynamicProcessor(self.api_client)
-        self.downloader = ImageDownloader()
+        self.state = state or StateStore(os.path.join(Config.SAVE_PATH, "crawl_state.db"))
+        self.downloader = downloader or ImageDownloader(self.http, self.state)
+        self.progress = Progress()
+        self.image_pool = ThreadPoolExecutor(max_workers=Config.IMAGE_WORKERS)
+        self.image_slots = threading.BoundedSemaphore(Config.IMAGE_QUEUE_SIZE)
+        self.dynamic_pool = ThreadPoolExecutor(max_workers=Config.DYNAMIC_WORKERS)
+        # 限制已提交但未完成的动态数量, 避免动态列表翻得比评论抓取快太多
+        self.dynamic_slots = threading.BoundedSemaphore(Config.DYNAMIC_WORKERS * 2)
+        self.retry_policy = RetryPolicy(max_attempts=Config.RETRY_MAX_ATTEMPTS, base_delay=Config.RETRY_BASE_DELAY)
+
+    def submit(self, dynamic, base_path=None):
+        """
+        提交一条动态的评论区抓取, 待处理的动态过多时阻塞
+        :param base_path: 评论图片的保存目录, 为空时使用下载器的默认目录
+        """
+        if not dynamic.comment_oid or not dynamic.timestamp:
+            return
+        self.dynamic_slots.acquire()
+        future = self.dynamic_pool.submit(self._process_counted, dynamic, base_path)
+        future.add_done_callback(lambda _: self.dynamic_slots.release())
+
+    def finish(self):
+        """等待已提交的动态及其图片全部处理完"""
+        self.dynamic_pool.shutdown(wait=True)
+        self.image_pool.shutdown(wait=True)
     
     def process_all_dynamics(self):
-        """处理所有动态"""
+        """处理所有动态: 多条动态的评论区并发抓取, 共享同一个限速器"""
         offset = ""
         page_num = 1
+        failures = 0
         
         while True:
             print(f"\n正在获取第 {page_num} 页动态...")
             has_more, new_offset, items = self.api_client.fetch_dynamic_page(offset)
             
-            if not items:
-                print("等待5秒后重试...")
-                time.sleep(5)
+            if has_more is None:
+                # 暂时性错误按指数退避重试, 连续失败过多时放弃
+                failures += 1
+                if self.retry_policy.exhausted(failures):
+                    print(f"动态列表连续 {failures} 次请求失败, 停止抓取")
+                    break
+                delay = self.retry_policy.delay(failures)
+                print(f"等待 {delay:.0f} 秒后重试...")
+                self.http.metrics.add_sleep("feed_backoff", delay)
+                time.sleep(delay)
                 continue
+            failures = 0
+            if not items:
+                print("没有更多动态")
+                break
+            
+            # 评论多的动态先抓, 长耗时的评论区尽早开始
+            dynamics = [self.dynamic_processor.parse_dynamic_item(item) for item in items]
+            dynamics = [dynamic for dynamic in dynamics if dynamic is not None]
+            dynamics.sort(key=lambda dynamic: dynamic.comment_count or 0, reverse=True)
             
             # 处理本页动态
-            for item in items:
-                self.process_single_dynamic(item)
+            for dynamic in dynamics:
+                self.submit(dynamic)
             
             if not has_more:
-                print("\n所有动态已处理完毕")
                 break
             
             offset = new_offset
             page_num += 1
-            time.sleep(random.uniform(1.0, 1.5))
+        self.finish()
+        print("\n所有动态已处理完毕")
+        self.progress.report()
+
+    def _process_counted(self, dynamic, base_path=None):
+        try:
+            with self.http.metrics.timer("comment.dynamic"):
+                self.process_single_dynamic(dynamic, base_path)
+        except Exception as e:
+            print(f"处理动态出错: {str(e)}")
+        finally:
+            done = self.progress.add(dynamics=1)
+            if done % Config.PROGRESS_EVERY == 0:
+                self.progress.report()
     
-    def process_single_dynamic(self, item):
+    def process_single_dynamic(self, dynamic, base_path=None):
         """处理单个动态"""
-        oid, pub_date, dynamic_type = self.dynamic_processor.parse_dynamic_item(item)
-        if not all([oid, pub_date, dynamic_type]):
+        oid, dynamic_type = dynamic.comment_oid, dynamic.comment_type
+        pub_date = datetime.fromtimestamp(dynamic.timestamp)
+
+        # feed/space 已给出评论数, 没有评论时不必请求评论接口
+        if dynamic.comment_count == 0:
+            self.progress.add(skipped=1)
             return
+
+        # 抓取过的动态: 太旧的冻结, 评论数没变的跳过, 其余只抓新评论
+        cursor = self.state.comment_cursor(oid, dynamic_type)
+        if cursor:
+            if Config.FREEZE_DAYS and time.time() - dynamic.timestamp > Config.FREEZE_DAYS * 86400:
+                print(f"动态 {oid} 发布已超过 {Config.FREEZE_DAYS} 天, 跳过")
+                return
+            if dynamic.comment_count is not None and dynamic.comment_count == cursor["reply_count"]:
+                print(f"动态 {oid} 评论数未变化 ({dynamic.comment_count}), 跳过")
+                return
         
         print(f"\n处理动态 {oid} ({pub_date})")
         
-        # 获取图片
-        images = self._get_all_images(oid, dynamic_type)
-        print(f"发现 {len(images)} 张图片")
+        # 每拿到一页评论就开始下载其中的图片
+        crawl = {
+            "since_rpid": cursor["last_rpid"] if cursor else None,
+            "max_rpid": cursor["last_rpid"] if cursor else None,
+            "max_pages": self._max_reply_pages(dynamic, cursor),
+            "complete": True,
+        }
+        save_folder = None
+        found = 0
+        downloads = []
+        for images in self._iter_image_pages(oid, dynamic_type, crawl):
+            if not images:
+                continue
+            if save_folder is None:
+                try:
+                    # 仅在发现图片时创建文件夹
+                    save_folder = self.downloader.create_folder(pub_date, base_path)
+                except Exception as e:
+                    print(f"创建文件夹失败: {str(e)}")
+                    return
+            for img_url in images:
+                # 待下载的图片达到上限时阻塞在这里, 暂停翻页
+                self.image_slots.acquire()
+                future = self.image_pool.submit(self._download_safely, img_url, save_folder)
+                future.add_done_callback(lambda _: self.image_slots.release())
+                downloads.append(future)
+            found += len(images)
 
         # 如果没有图片则跳过
-        if not images:
-            print("没有发现图片，跳过创建文件夹")
-            return
+        if not found:
+            print(f"动态 {oid} 没有发现图片，跳过创建文件夹")
+        else:
+            print(f"动态 {oid} 发现 {found} 张图片")
+
+        # 等本条动态的图片全部下载结束; 有失败时不推进位置, 下次重新翻这些评论并重试
+        failed = sum(1 for future in downloads if not future.result())
+        if failed:
+            print(f"动态 {oid} 有 {failed}/{len(downloads)} 张评论图片下载失败, 下次运行重试")
+            crawl["complete"] = False
+
+        # 评论页全部成功获取且图片都已下载后才记录位置, 下次从这里继续
+        if crawl["complete"]:
+            self.state.save_comment_cursor(oid, dynamic_type, crawl["max_rpid"], dynamic.comment_count, dynamic.timestamp)
+
+    def _download_safely(self, img_url, save_folder):
+        """:return: 图片是否已在本地"""
         try:
-            # 仅在发现图片时创建文件夹
-            save_folder = self.downloader.create_folder(pub_date)
+            return self.downloader.download(img_url, save_folder)
         except Exception as e:
-            print(f"创建文件夹失败: {str(e)}")
-            return
-        
-        # 下载图片
-        save_folder = self.downloader.create_folder(pub_date)
-        for idx, img_url in enumerate(images, 1):
-            self.downloader.download(img_url, save_folder)
-            if idx % 5 == 0:
-                time.sleep(random.uniform(*Config.DELAY_RANGE))
+            print(f"下载图片出错 {img_url}: {str(e)}")
+            return False
     
-    def _get_all_images(self, oid, dynamic_type):
-        """获取动态所有图片"""
-        images = []
+    @staticmethod
+    def _max_reply_pages(dynamic, cursor):
+        """按评论数 (增量时按新增评论数) 估算最多需要翻的页数, 评论数未知时不限制"""
+        if dynamic.comment_count is None:
+            return Config.MAX_REPLY_PAGES or None
+        new_replies = dynamic.comment_count - ((cursor or {}).get("reply_count") or 0)
+        if new_replies <= 0:
+            new_replies = dynamic.comment_count
+        pages = new_replies // Config.REPLY_PAGE_SIZE + 1
+        if Config.MAX_REPLY_PAGES:
+            pages = min(pages, Config.MAX_REPLY_PAGES)
+        return pages
+
+    def _iter_image_pages(self, oid, dynamic_type, crawl):
+        """
+        逐页获取评论, 每页产出其中的图片地址列表
+        :param crawl: 抓取位置, crawl["since_rpid"] 不为空时按时间倒序只取更新的评论;
+                      过程中更新 crawl["max_rpid"], 请求失败时把 crawl["complete"] 置为 False
+        """
+        since_rpid = crawl["since_rpid"]
+        mode = 2 if since_rpid else 3
         next_page = 0
+        pages = 0
         
         while True:
-            is_end, new_page, replies = self.api_client.fetch_comments(oid, dynamic_type, next_page)
+            is_end, new_page, replies = self.api_client.fetch_comments(oid, dynamic_type, next_page, mode)
+            self.progress.add(reply_pages=1)
+            if is_end is None:
+                crawl["complete"] = False
+                break
             
             # 提取图片
+            images = []
+            reached_seen = False
             for reply in replies:
+                rpid = reply.get("rpid") or 0
+                if since_rpid and rpid <= since_rpid:
+                    reached_seen = True
+                    continue
+                if crawl["max_rpid"] is None or rpid > crawl["max_rpid"]:
+                    crawl["max_rpid"] = rpid
                 images += self._extract_images(reply)
-                for sub_reply in reply.get("replies", []):
+                for sub_reply in reply.get("replies") or []:
                     images += self._extract_images(sub_reply)
+            yield images
+            pages += 1
             
-            if is_end:
+            if is_end or reached_seen:
+                break
+            if crawl["max_pages"] and pages >= crawl["max_pages"]:
+                # 按评论数估算的页数已经翻完
                 break
             
             next_page = new_page
-        
-        return images
     
     def _extract_images(self, reply):
-        """从回复中提取图片"""
+        """从回复中提取图片, 按 IMAGE_VARIANT 换成缩小版地址"""
         if "content" in reply and "pictures" in reply["content"]:
-            return [pic["img_src"] for pic in reply["content"]["pictures"]]
+            return [self.downloader.variants.choose("comments", pic)[0] for pic in reply["content"]["pictures"]]
         return []
 
 def main():
     """程序入口"""
+    parser = argparse.ArgumentParser(description="下载B站用户动态评论区中的图片")
+    parser.add_argument("--base-url", help="把B站接口与图片请求改发到这个地址, 如本地模拟服务器 http://127.0.0.1:8765")
+    args = parser.parse_args()
+    if args.base_url:
+        Config.BASE_URL = args.base_url
+
     controller = MainController()
     print(f"开始爬取用户 {Config.USER_MID} 的动态...")
-    controller.process_all_dynamics()
+    try:
+        with profiled(Config.PROFILE_PATH):
+            controller.process_all_dynamics()
+    finally:
+        if controller.downloader.skipped:
+            print(f"本地已存在而跳过的下载: {controller.downloader.skipped} 张")
+        if controller.downloader.blobs is not None:
+            controller.downloader.blobs.print_stats()
+        controller.downloader.variants.print_stats()
+        controller.downloader.postprocess.close()
+        controller.downloader.postprocess.print_stats()
+        controller.http.print_stats()
+        controller.http.close()
+        controller.state.close()
+        if Config.WRITE_REPORT:
+            controller.http.metrics.write_report(os.path.join(Config.SAVE_PATH, "reports"), "bili_comment", {
+                "dynamics": controller.progress.dynamics,
+                "reply_pages": controller.progress.reply_pages,
+                "skipped_no_comments": controller.progress.skipped,
+                "skipped_images": controller.downloader.skipped,
+            })
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,27 @@
 import os
 import re
+import copy
+import random
+import argparse
 import json
 import time
-import requests
 import datetime
-import random
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+import bili_comment
+from bili_blobstore import BlobStore
+from bili_catalog import Catalog
+from bili_http import HttpClient
+from bili_manifest import ManifestExecutor, ManifestWriter, merge_done, parse_range, parse_shard
+from bili_metrics import profiled
+from bili_model import Dynamic
+from bili_postprocess import PostProcessor
+from bili_ratelimit import DEFAULT_LIMITS, RateLimiter
+from bili_retry import PERMANENT_DETAIL_CODES, RetryPolicy, is_permanent_error
+from bili_state import STATUS_DEAD, STATUS_FAILED, STATUS_PLANNED, StateStore
+from bili_variant import VariantSelector
 
 def load_config():
     """加载配置文件 config.json。如果不存在或缺少键，则报错退出。"""
@@ -42,22 +59,42 @@ class Config:
         self.base_dir = self.settings["base_dir"]
         self.interval = self.settings["interval"]
         self.uid_list = self.get_uid_list()
+
+        # 全部请求共用的连接池与限速器, 请求头与 Cookie 统一在 HttpClient 中设置
+        self.http = HttpClient(
+            cookie=self.COOKIE,
+            pool_maxsize=self.settings.get("HTTP_POOL_SIZE", 10),
+            host_pool_sizes=self.settings.get("HTTP_HOST_POOL_SIZES"),
+            limiter=RateLimiter(self.get_rate_limits()),
+            base_url=self.settings.get("BASE_URL")
+        )
         
         print("配置加载成功:")
         print(f" - UID列表: {self.uid_list}")
-        print(f" - 下载间隔: {self.interval} 秒")
+        print(f" - 动态列表初始请求间隔: {self.interval} 秒")
         print(f" - 保存基目录: {self.base_dir}")
 
         self.uid = None
         self.download_dir = None
         self.username = None
-        self.username_cache = {}
         self.saved_url_filename = None
         self.unsaved_url_filename = None
         self.date_log_filename = None
 
         if not os.path.exists(self.base_dir):
             os.makedirs(self.base_dir)
+        # 所有 UID 共用的抓取状态库, 失败的动态按退避策略安排重试
+        self.retry_policy = RetryPolicy(
+            max_attempts=int(self.settings.get("RETRY_MAX_ATTEMPTS", 5)),
+            base_delay=float(self.settings.get("RETRY_BASE_DELAY", 30)),
+            max_delay=float(self.settings.get("RETRY_MAX_DELAY", 21600))
+        )
+        self.state = StateStore(os.path.join(self.base_dir, "crawl_state.db"), self.retry_policy)
+        # 已保存动态的目录与全文索引, 用 python bili_catalog.py search/rebuild 查询或重建
+        self.catalog = Catalog(os.path.join(self.base_dir, "catalog.db"), self.base_dir)
+        # 用户名、头像缓存在状态库中, 超过 USER_INFO_TTL_DAYS 天才重新请求
+        self.user_info_ttl = float(self.settings.get("USER_INFO_TTL_DAYS", 7)) * 86400
+        self.dir_index = UserDirIndex(self.base_dir)
 
     def get_cookie(self):
         """从配置中获取COOKIE，如果长度不足则提示用户在终端输入。"""
@@ -81,100 +118,160 @@ class Config:
         
         return parsed_uids
 
+    def get_rate_limits(self):
+        """interval 作为动态列表接口的初始间隔, RATE_LIMITS 可覆盖各接口的 [初始速率, 最大速率]"""
+        limits = {}
+        if self.interval and self.interval > 0:
+            limits["feed"] = (1 / self.interval, DEFAULT_LIMITS["feed"][1])
+        limits.update(self.settings.get("RATE_LIMITS", {}))
+        return limits
+
     def get_username(self, uid):
-        if uid in self.username_cache:
-            return self.username_cache[uid]
+        """用户名优先取状态库中未过期的缓存, 过期或没有缓存时才请求用户信息接口"""
+        cached = self.state.user_info(uid)
+        if cached and time.time() - (cached["last_seen"] or 0) < self.user_info_ttl:
+            return cached["username"]
         url = f"https://api.bilibili.com/x/space/acc/info?mid={uid}"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36 Edg/122.0.0.0",
-            "Cookie": self.COOKIE
-        }
         try:
-            time.sleep(3)
-            response = requests.get(url, headers=headers, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("code") == 0:
-                    username = data.get("data", {}).get("name", f"用户_{uid}")
-                    self.username_cache[uid] = username
-                    return username
-                else:
-                    print(f"获取用户名失败: {data.get('message')}")
+            data = self.http.get_json(url, endpoint="user_info", timeout=10)
+            if data.get("code") == 0:
+                info = data.get("data") or {}
+                username = info.get("name") or f"用户_{uid}"
+                self.state.save_user_info(uid, username, info.get("face"))
+                return username
             else:
-                print(f"API请求失败，状态码: {response.status_code}")
+                print(f"获取用户名失败: {data.get('message')}")
         except Exception as e:
             print(f"获取用户名异常: {e}")
+        # 接口失败时沿用过期的缓存或已有文件夹中的用户名
+        if cached:
+            return cached["username"]
+        folder = self.dir_index.get(uid)
+        if folder:
+            return self.folder_username(folder, uid)
         return f"用户_{uid}"
 
+    @staticmethod
+    def folder_username(folder, uid):
+        """从 "用户名_UID" 文件夹名中取出用户名"""
+        return os.path.basename(folder)[:-len(uid) - 1]
+
     def get_download_dir(self, base_dir, uid):
-        for subdir in os.listdir(base_dir):
-            subdir_path = os.path.join(base_dir, subdir)
-            if os.path.isdir(subdir_path) and uid in subdir:
-                print(f'检测到同名"{uid}",跳过通过api获取用户名')
-                return subdir_path
+        existing = self.dir_index.get(uid)
+        if existing:
+            return existing
         username = self.get_username(uid)
         new_folder_name = f"{username}_{uid}"
         new_folder_path = os.path.join(base_dir, new_folder_name)
         os.makedirs(new_folder_path, exist_ok=True)
+        self.dir_index.add(uid, new_folder_path)
         print(f"创建新文件夹: {new_folder_path}")
         return new_folder_path
 
     def update_for_uid(self, uid):
         self.uid = uid
         self.download_dir = self.get_download_dir(self.base_dir, uid)
-        self.username = self.get_username(uid)
+        # 用户名只用于显示, 已有文件夹时不为它请求接口
+        cached = self.state.user_info(uid)
+        self.username = cached["username"] if cached else self.folder_username(self.download_dir, uid)
         self.saved_url_filename = os.path.join(self.download_dir, "saved_url.txt")
         self.unsaved_url_filename = os.path.join(self.download_dir, "unsaved_url.txt")
         self.date_log_filename = os.path.join(self.download_dir, "date.log")
         if not os.path.exists(self.download_dir):
             os.makedirs(self.download_dir)
 
+    def for_uid(self, uid):
+        """返回指定 UID 的独立配置副本, 共享 settings、HttpClient、状态库与目录索引"""
+        uid_config = copy.copy(self)
+        uid_config.update_for_uid(uid)
+        return uid_config
+
+class UserDirIndex:
+    """base_dir 下 "用户名_UID" 文件夹的索引, 每次运行只扫描一次目录, 按 UID 后缀精确匹配"""
+    FOLDER_PATTERN = re.compile(r"_(\d+)$")
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self.lock = threading.Lock()
+        self.paths = None
+
+    def _scan(self):
+        paths = {}
+        if os.path.isdir(self.base_dir):
+            for entry in sorted(os.scandir(self.base_dir), key=lambda entry: entry.name):
+                match = self.FOLDER_PATTERN.search(entry.name)
+                if match and entry.is_dir():
+                    paths.setdefault(match.group(1), entry.path)
+        return paths
+
+    def get(self, uid):
+        with self.lock:
+            if self.paths is None:
+                self.paths = self._scan()
+            return self.paths.get(uid)
+
+    def add(self, uid, path):
+        with self.lock:
+            if self.paths is None:
+                self.paths = self._scan()
+            self.paths[uid] = path
+
 class FileManager:
+    """单个 UID 的抓取状态, 读写 StateStore; 首次使用时导入旧的 saved_url.txt / unsaved_url.txt / date.log"""
     def __init__(self, config: Config):
         self.config = config
-        self.ensure_file_exists(self.config.saved_url_filename)
-        self.ensure_file_exists(self.config.unsaved_url_filename)
-        self.ensure_file_exists(self.config.date_log_filename)
-
-    def ensure_file_exists(self, filename):
-        if not os.path.exists(filename):
-            with open(filename, 'w', encoding='utf-8') as f:
-                pass
-
-    def load_url_set(self, filename):
-        if os.path.exists(filename):
-            with open(filename, 'r', encoding='utf-8') as f:
-                return {line.strip() for line in f if line.strip()}
-        return set()
-
-    def write_url_file(self, filename, urls):
-        with open(filename, 'w', encoding='utf-8') as f:
-            for url in urls:
-                f.write(url + "\n")
+        self.state = config.state
+        self.uid = config.uid
+        self.state.import_legacy(
+            self.uid,
+            self.config.saved_url_filename,
+            self.config.unsaved_url_filename,
+            self.config.date_log_filename
+        )
+
+    def is_saved(self, dynamic_id):
+        return self.state.is_saved(self.uid, dynamic_id)
+
+    def mark_saved(self, dynamic_id, time_num):
+        self.state.mark_saved(self.uid, dynamic_id, time_num)
+
+    def mark_failed(self, dynamic_id, reason="", time_num=None):
+        self.state.mark_failed(self.uid, dynamic_id, reason, time_num)
+
+    def mark_dead(self, dynamic_id, reason=""):
+        self.state.mark_dead(self.uid, dynamic_id, reason)
+
+    def mark_planned(self, dynamic_id, time_num):
+        self.state.mark_planned(self.uid, dynamic_id, time_num)
+
+    def failed_ids(self):
+        return self.state.failed_ids(self.uid)
+
+    def due_retries(self):
+        return self.state.due_retries(self.uid)
+
+    def checkpoint(self):
+        return self.state.checkpoint(self.uid)
+
+    def update_checkpoint(self, dynamic_id, timestamp):
+        self.state.update_checkpoint(self.uid, dynamic_id, timestamp)
+
+    def save_planned_checkpoint(self, dynamic_id, timestamp):
+        self.state.save_planned_checkpoint(self.uid, dynamic_id, timestamp)
+
+    def promote_planned_checkpoint(self):
+        return self.state.promote_planned_checkpoint(self.uid)
+
+    def is_planned(self, dynamic_id):
+        return self.state.status(self.uid, dynamic_id) == STATUS_PLANNED
 
     def read_date_log(self):
-        """只读取 date.log 第一行的数字作为截止时间"""
-        if os.path.exists(self.config.date_log_filename):
-            with open(self.config.date_log_filename, 'r', encoding='utf-8') as f:
-                lines = [line.strip() for line in f if line.strip()]
-                if lines and lines[0].isdigit():
-                    return int(lines[0])
-        return None
-
-    def read_date_log_lines(self):
-        """读取 date.log 中的所有日期，返回列表"""
-        if os.path.exists(self.config.date_log_filename):
-            with open(self.config.date_log_filename, 'r', encoding='utf-8') as f:
-                lines = [line.strip() for line in f if line.strip()]
-                return [int(line) for line in lines if line.isdigit()]
-        return []
-
-    def write_sorted_date_log(self, date_list):
-        """将排序后的日期列表写入 date.log"""
-        sorted_dates = sorted(date_list, reverse=True)
-        with open(self.config.date_log_filename, 'w', encoding='utf-8') as f:
-            for date in sorted_dates:
-                f.write(str(date) + "\n")
+        """已保存动态中最新的发布时间, 作为 date 模式的截止时间"""
+        return self.state.latest_time_num(self.uid)
+
+    def flush(self):
+        self.state.flush()
+        self.config.catalog.flush()
 
 class Utils:
     ILLEGAL_CHAR_PATTERN = r'[#@.<>:"/\\|?*\n\r]'
@@ -189,12 +286,15 @@ class Utils:
         return name
 
     @staticmethod
-    def parse_dynamic_card(card_str):
-        try:
-            return json.loads(card_str)
-        except Exception as e:
-            print("解析 card 失败:", e)
-            return {}
+    def write_text_if_changed(path, content):
+        """内容与已有文件相同时不再重写, 返回是否写入"""
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                if f.read() == content:
+                    return False
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return True
 
     @staticmethod
     def format_datetime(timestamp):
@@ -206,81 +306,259 @@ class Utils:
         dt = datetime.datetime.fromtimestamp(timestamp)
         return int(f"{dt.year:04d}{dt.month:02d}{dt.day:02d}{dt.hour:02d}{dt.minute:02d}")
 
+    @staticmethod
+    def num_to_timestamp(time_num):
+        return datetime.datetime.strptime(str(time_num), "%Y%m%d%H%M").timestamp()
+
 class Downloader:
     def __init__(self, config: Config):
         self.config = config
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.93 Safari/537.36",
-            "Cookie": config.COOKIE
-        }
+        self.http = config.http
+        # 并发下载: DOWNLOAD_WORKERS 为线程池大小 (1 即逐张串行), MAX_PER_HOST 限制同一 CDN 主机的并发数
+        self.max_workers = max(1, int(config.settings.get("DOWNLOAD_WORKERS", 4)))
+        self.max_per_host = max(1, int(config.settings.get("MAX_PER_HOST", 2)))
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers) if self.max_workers > 1 else None
+        self._host_slots = {}
+        self._host_lock = threading.Lock()
+        self.saved_files = 0
+        self.saved_bytes = 0
+        self.skipped_files = 0
+        # 下载写盘的缓冲块大小 (字节)
+        self.chunk_size = int(config.settings.get("DOWNLOAD_CHUNK_SIZE", 65536))
+        # IMAGE_DEDUP: "link" 重复图片硬链接到内容仓库, "copy" 复制, "off" 关闭去重
+        dedup_mode = config.settings.get("IMAGE_DEDUP", "link")
+        self.blobs = None
+        if dedup_mode != "off":
+            self.blobs = BlobStore(os.path.join(config.base_dir, ".blobs"), dedup_mode)
+        # IMAGE_VARIANTS: 按 UID 选择下载原图或 CDN 缩小版, 其余 UID 的动态图片使用 "dynamics", 再没有时使用 "default"
+        self.variants = VariantSelector(config.settings.get("IMAGE_VARIANTS"))
+        # POSTPROCESS_WORKERS > 0 时在进程池中生成缩略图、重压缩大 PNG、去除元数据 (需要 Pillow)
+        self.postprocess = PostProcessor(
+            config.state,
+            config.base_dir,
+            workers=int(config.settings.get("POSTPROCESS_WORKERS", 0)),
+            thumbnail_size=int(config.settings.get("THUMBNAIL_SIZE", 0)),
+            recompress_png_kb=int(config.settings.get("RECOMPRESS_PNG_KB", 0)),
+            strip_metadata=bool(config.settings.get("STRIP_METADATA", False))
+        )
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc
+        with self._host_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_slots[host]
 
     def download_file(self, url, filepath):
+        """下载单个文件，返回是否成功; 本地已有完整文件时跳过, 开启去重时已下载过的图片直接引用"""
+        with self.http.metrics.timer("download_file"):
+            try:
+                return self._download_file(url, filepath)
+            finally:
+                self.variants.discard(url)
+
+    def _download_file(self, url, filepath):
         try:
-            delay_first = self.config.settings.get("DELAY_FIRST", 0.1)
-            delay_last = self.config.settings.get("DELAY_LAST", 0.2)
-            time.sleep(random.uniform(delay_first, delay_last))
-            
-            r = requests.get(url, headers=self.headers, stream=True, timeout=10)
-            if r.status_code == 200:
-                with open(filepath, 'wb') as f:
-                    for chunk in r.iter_content(1024):
-                        f.write(chunk)
-                print(f"保存文件: {filepath}")
+            if self.is_present(url, filepath):
+                with self._host_lock:
+                    self.skipped_files += 1
+                print(f"文件已存在, 跳过下载: {filepath}")
+                self.postprocess.submit(filepath, url)
+                return True
+            if self.blobs is not None:
+                ok = self.blobs.fetch(url, filepath, self._fetch)
             else:
-                print(f"下载失败 {url} 状态码: {r.status_code}")
+                ok = self._fetch(url, filepath)
         except Exception as e:
             print(f"下载 {url} 出错: {e}")
+            return False
+        if ok:
+            self.config.state.record_file(self._manifest_key(filepath), url, os.path.getsize(filepath))
+            print(f"保存文件: {filepath}")
+            self.postprocess.submit(filepath, url)
+        return ok
+
+    def _manifest_key(self, filepath):
+        return os.path.relpath(filepath, self.config.base_dir)
+
+    def is_recorded(self, filepath):
+        """本地文件与图片清单记录的大小一致, 不发出任何请求"""
+        if not os.path.isfile(filepath):
+            return False
+        return self.config.state.file_size(self._manifest_key(filepath)) == os.path.getsize(filepath)
+
+    def is_present(self, url, filepath):
+        """
+        本地文件是否完整: 与图片清单记录的大小比对,
+        清单中没有记录的旧文件用 HEAD 请求核对 Content-Length
+        """
+        if not os.path.isfile(filepath):
+            return False
+        size = os.path.getsize(filepath)
+        key = self._manifest_key(filepath)
+        recorded = self.config.state.file_size(key)
+        if recorded is not None:
+            return recorded == size
+        try:
+            with self._host_slot(url):
+                response = self.http.head(url, endpoint="image", timeout=10)
+        except Exception as e:
+            # HEAD 失败不代表文件不完整, 交给正常的下载/续传流程判断
+            print(f"核对文件大小失败 {url}: {e}")
+            return False
+        if response.status_code != 200:
+            return False
+        length = response.headers.get("Content-Length")
+        if length is not None and length.isdigit() and int(length) == size:
+            self.config.state.record_file(key, url, size)
+            return True
+        return False
+
+    def _fetch(self, url, filepath):
+        with self._host_slot(url):
+            # 先写入 .part 临时文件, 完整后才重命名, 中断的下载下次用 Range 续传
+            size = self.http.download(url, filepath, endpoint="image", chunk_size=self.chunk_size, timeout=10)
+            with self._host_lock:
+                self.saved_files += 1
+                self.saved_bytes += size
+            self.variants.record(url, os.path.getsize(filepath))
+            return True
+
+    def download_many(self, jobs):
+        """
+        并发下载一组 (url, filepath)，全部完成后按原顺序返回 [(url, filepath, 是否成功)]
+        """
+        if self.pool is None or len(jobs) <= 1:
+            return [(url, filepath, self.download_file(url, filepath)) for url, filepath in jobs]
+        futures = [self.pool.submit(self.download_file, url, filepath) for url, filepath in jobs]
+        return [(url, filepath, future.result()) for (url, filepath), future in zip(jobs, futures)]
+
+    def print_stats(self):
+        if self.skipped_files:
+            print(f"本地已存在而跳过的下载: {self.skipped_files} 张")
+        if self.blobs is not None:
+            self.blobs.print_stats()
+        self.variants.print_stats()
+        self.postprocess.print_stats()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+        self.postprocess.close()
 
 class DynamicProcessor:
-    def __init__(self, config: Config, file_manager: FileManager, downloader: Downloader, saved_url_set: set, date_log_num: int, method: str):
+    def __init__(self, config: Config, file_manager: FileManager, downloader: Downloader, date_log_num: int, method: str,
+                 planner=None):
+        """
+        :param planner: ManifestWriter, 给出时为计划模式: 图片任务写入清单而不下载, 动态记为 planned
+        """
         self.config = config
         self.file_manager = file_manager
         self.downloader = downloader
-        self.saved_url_set = saved_url_set
         self.date_log_num = date_log_num
         self.method = method
+        self.planner = planner
+        # url 模式下连续遇到 STOP_AFTER_KNOWN 条已知动态 (置顶除外) 即停止, 0 表示不提前停止
+        self.stop_after_known = int(self.config.settings.get("STOP_AFTER_KNOWN", 5))
+        self.checkpoint_id, _ = self.file_manager.checkpoint()
+        self.known_streak = 0
+        self.newest = None
         self.txt_folder = os.path.join(self.config.download_dir, "txt")
         if not os.path.exists(self.txt_folder):
             os.makedirs(self.txt_folder)
 
-    def process_dynamic(self, dynamic, success_list, failed_list):
+    def is_known(self, dynamic_id):
+        """不晚于高水位线, 或已保存的动态; 计划模式下已写入清单 (planned) 的动态也算已知, 不重复列入"""
+        if self.checkpoint_id is not None and int(dynamic_id) <= self.checkpoint_id:
+            return True
+        if self.planner is not None and self.file_manager.is_planned(dynamic_id):
+            return True
+        return self.file_manager.is_saved(dynamic_id)
+
+    def page_is_final(self, dynamics):
+        """根据截止日期或高水位线判断这一页之后是否还需要继续翻页"""
+        streak = 0
+        for dynamic in dynamics:
+            if dynamic.pinned:
+                continue
+            if self.method == 'date':
+                timestamp = dynamic.timestamp
+                if self.date_log_num and timestamp and Utils.timestamp_to_num(timestamp) < self.date_log_num:
+                    return True
+            elif self.stop_after_known and self.checkpoint_id is not None:
+                dynamic_id = dynamic.dynamic_id
+                streak = streak + 1 if dynamic_id and int(dynamic_id) <= self.checkpoint_id else 0
+                if streak >= self.stop_after_known:
+                    return True
+        return False
+
+    def _advance(self, dynamic_id, timestamp):
+        if self.newest is None or int(dynamic_id) > int(self.newest[0]):
+            self.newest = (dynamic_id, timestamp)
+
+    def seed_checkpoint(self, dynamics):
+        """
+        还没有高水位线 (如刚从旧文本文件导入、之后没有新动态) 而第一页的动态都已保存时,
+        用其中最新的一条作为高水位线, 之后的运行才能在第一页就停止翻页
+        """
+        if self.checkpoint_id is not None or self.newest is not None:
+            return
+        candidates = [dynamic for dynamic in dynamics if not dynamic.pinned and dynamic.dynamic_id]
+        if candidates and all(self.file_manager.is_saved(dynamic.dynamic_id) for dynamic in candidates):
+            newest = max(candidates, key=lambda dynamic: int(dynamic.dynamic_id))
+            self._advance(newest.dynamic_id, newest.timestamp)
+
+    def process_dynamic(self, dynamic: Dynamic, success_list, failed_list):
+        """
+        :return: 动态是否在本次抓取范围内 (已处理或已保存过); 早于截止日期的置顶动态与无法解析的动态为 False,
+                 到达截止日期或连续已知时抛出 StopIteration
+        """
+        with self.config.http.metrics.timer("process_dynamic"):
+            return self._process_dynamic(dynamic, success_list, failed_list)
+
+    def _process_dynamic(self, dynamic: Dynamic, success_list, failed_list):
         dynamic_url = None
+        dynamic_time_num = None
         try:
-            desc = dynamic.get("desc", {})
-            dynamic_id = desc.get("dynamic_id")
+            dynamic_id = dynamic.dynamic_id
             if not dynamic_id:
                 print("无法获取 dynamic_id, 跳过该动态")
-                return
-            dynamic_id = str(dynamic_id)
-            dynamic_url = f"https://t.bilibili.com/{dynamic_id}"
+                return False
+            dynamic_url = dynamic.url
 
-            if self.method == 'url' and dynamic_url in self.saved_url_set:
+            # 置顶动态不参与截止判断, 也不推进高水位线
+            pinned = dynamic.pinned
+            if self.method == 'url' and self.is_known(dynamic_id):
                 print(f"动态 {dynamic_url} 已下载, 跳过。")
-                return
+                if not pinned:
+                    self.known_streak += 1
+                    if self.stop_after_known and self.known_streak >= self.stop_after_known:
+                        raise StopIteration(f"连续 {self.known_streak} 条动态已保存, 停止爬取")
+                return True
+            if not pinned:
+                self.known_streak = 0
 
-            timestamp = desc.get("timestamp")
+            timestamp = dynamic.timestamp
             if not timestamp:
                 print("无法获取 timestamp, 跳过该动态")
-                return
+                return False
             dynamic_time_num = Utils.timestamp_to_num(timestamp)
 
             if self.method == 'date' and self.date_log_num and dynamic_time_num < self.date_log_num:
+                if pinned:
+                    print(f"置顶动态 {dynamic_url} 早于截止日期, 跳过")
+                    return False
                 print(f"动态 {dynamic_url} 的发布时间 {dynamic_time_num} 早于截止日期 {self.date_log_num}, 停止爬取")
                 raise StopIteration("已经到了截止日期")
 
             time_str = Utils.format_datetime(timestamp)
-            card_str = dynamic.get("card", "")
-            card_dict = Utils.parse_dynamic_card(card_str)
-            
             file_name_max_length = self.config.settings.get("FILE_NAME_MAX_LENGTH", 40)
 
-            dynamic_content = ""
-            if "item" in card_dict:
-                item = card_dict["item"]
-                dynamic_content = item.get("description", item.get("content", ""))
-
+            # 走到这里才解析 card
+            dynamic_content = dynamic.content
             has_content = bool(dynamic_content.strip())
-            pics = card_dict.get("item", {}).get("pictures", [])
+            info_text = f"URL: {dynamic_url}\n发布时间: {time_str}\n内容:\n{dynamic_content}"
+            pics = dynamic.pictures
 
             if not pics:
                 if has_content:
@@ -289,12 +567,9 @@ class DynamicProcessor:
                 else:
                     txt_filename = f"{time_str}-{dynamic_id}.txt"
                 txt_path = os.path.join(self.txt_folder, txt_filename)
-                with open(txt_path, 'w', encoding='utf-8') as f:
-                    f.write(f"URL: {dynamic_url}\n")
-                    f.write(f"发布时间: {time_str}\n")
-                    f.write("内容:\n")
-                    f.write(dynamic_content)
-                print(f"保存无图片动态到: {txt_path}")
+                if Utils.write_text_if_changed(txt_path, info_text):
+                    print(f"保存无图片动态到: {txt_path}")
+                catalog_entry = (txt_path, [])
             else:
                 if has_content:
                     content_clean = Utils.sanitize_filename(dynamic_content, file_name_max_length)
@@ -316,158 +591,478 @@ class DynamicProcessor:
                     print(f"文件夹已存在: {dynamic_folder}")
 
                 info_path = os.path.join(dynamic_folder, "info.txt")
-                with open(info_path, 'w', encoding='utf-8') as f:
-                    f.write(f"URL: {dynamic_url}\n")
-                    f.write(f"发布时间: {time_str}\n")
-                    f.write("内容:\n")
-                    f.write(dynamic_content)
-                print(f"保存动态信息到: {info_path}")
+                if Utils.write_text_if_changed(info_path, info_text):
+                    print(f"保存动态信息到: {info_path}")
 
+                jobs = []
                 for idx, pic in enumerate(pics, start=1):
-                    img_url = pic.get("img_src")
-                    if not img_url:
+                    if not pic.get("img_src"):
                         continue
-                    ext = os.path.splitext(img_url)[1] or ".jpg"
+                    # 按该 UID 的策略选择原图或缩小版, 扩展名与实际下载的格式一致
+                    img_url, ext = self.downloader.variants.choose(self.config.uid, pic, fallback="dynamics")
                     img_filename = f"{idx}{ext}"
                     img_path = os.path.join(dynamic_folder, img_filename)
                     print(f"下载图片: {img_url}")
-                    self.downloader.download_file(img_url, img_path)
+                    jobs.append((img_url, img_path))
+                catalog_entry = (info_path, [path for _, path in jobs])
 
-            self.saved_url_set.add(dynamic_url)
-            with open(self.config.saved_url_filename, 'a', encoding='utf-8') as f:
-                f.write(dynamic_url + "\n")
-            success_list.append(dynamic_url)
+                if self.planner is not None:
+                    # 计划模式: 本地已完整的图片不再列入清单, 其余交给执行端;
+                    # 合并完成记录时才记 saved/failed、登记动态目录, 不计入本次成功数
+                    for url, _ in jobs:
+                        self.downloader.variants.discard(url)
+                    jobs = [(url, path) for url, path in jobs if not self.downloader.is_recorded(path)]
+                    if jobs:
+                        self.planner.add(self.config.uid, dynamic_id, dynamic_time_num, timestamp, jobs)
+                        self.file_manager.mark_planned(dynamic_id, dynamic_time_num)
+                        if not pinned:
+                            # 只作为高水位线候选, 由 merge 在这些动态全部合并后写入
+                            self._advance(dynamic_id, timestamp)
+                        return True
 
-            with open(self.config.date_log_filename, 'a', encoding='utf-8') as f:
-                f.write(str(dynamic_time_num) + "\n")
+                # 等该动态的所有图片下载结束后再统一记录 saved/unsaved
+                results = self.downloader.download_many(jobs)
+                failed_images = [url for url, _, ok in results if not ok]
+                if failed_images:
+                    reason = f"{len(failed_images)}/{len(results)} 张图片下载失败"
+                    print(f"动态 {dynamic_url} 有 {reason}")
+                    self.file_manager.mark_failed(dynamic_id, reason, dynamic_time_num)
+                    failed_list.append(dynamic_url)
+                    return True
+
+            self.file_manager.mark_saved(dynamic_id, dynamic_time_num)
+            self.config.catalog.add(self.config.uid, dynamic_id, timestamp, dynamic_content, *catalog_entry)
+            success_list.append(dynamic_url)
+            if not pinned:
+                self._advance(dynamic_id, timestamp)
+            return True
         except StopIteration as e:
             raise e
         except Exception as e:
             print("处理动态出错:", e)
             if dynamic_url:
-                with open(self.config.unsaved_url_filename, 'a', encoding='utf-8') as f:
-                    f.write(dynamic_url + "\n")
+                self.file_manager.mark_failed(dynamic_id, str(e), dynamic_time_num)
                 failed_list.append(dynamic_url)
+            return dynamic_url is not None
 
 class BilibiliDynamicSpider:
-    def __init__(self, config: Config, file_manager: FileManager, dynamic_processor: DynamicProcessor):
+    def __init__(self, config: Config, file_manager: FileManager, dynamic_processor: DynamicProcessor,
+                 feed_space=False, on_dynamic=None):
+        """
+        :param feed_space: 用 feed/space 代替 space_history 列出动态, 其结果带有评论区 oid 与评论数
+        :param on_dynamic: 每条在抓取范围内的动态保存图片之后交给这个回调, 如评论区图片抓取
+        """
         self.config = config
         self.file_manager = file_manager
         self.dynamic_processor = dynamic_processor
-        self.saved_url_set = self.file_manager.load_url_set(self.config.saved_url_filename)
-        self.dynamic_processor.saved_url_set = self.saved_url_set
+        self.feed_space = feed_space
+        self.on_dynamic = on_dynamic
         self.success_list = []
         self.failed_list = []
+        # 是否翻到了动态列表的末尾
+        self.exhausted = False
+
+    SPACE_HISTORY_URL = "https://api.vc.bilibili.com/dynamic_svr/v1/dynamic_svr/space_history"
+    FEED_SPACE_URL = "https://api.bilibili.com/x/polymer/web-dynamic/v1/feed/space"
+
+    def fetch_page(self, offset):
+        """
+        请求一页 space_history (feed_space 时为 feed/space)
+        :return: (dynamics, next_offset)，dynamics 为 Dynamic 列表, next_offset 为 None 表示没有下一页; 请求失败或无数据时 dynamics 为 None
+        """
+        if self.feed_space:
+            url, params = self.FEED_SPACE_URL, {"host_mid": self.config.uid, "offset": offset or ""}
+        else:
+            url, params = self.SPACE_HISTORY_URL, {"host_uid": self.config.uid, "offset_dynamic_id": offset}
+        try:
+            data = self.config.http.get_json(url, endpoint="feed", params=params, timeout=10)
+        except Exception as e:
+            print(f"请求动态列表出错: {e}")
+            return None, None
+        if data.get("code") != 0:
+            print("接口返回错误信息:", data.get("message", ""))
+            return None, None
+
+        data_data = data.get("data", {})
+        if self.feed_space:
+            dynamics = [Dynamic.from_feed_space(item) for item in data_data.get("items") or []]
+        else:
+            dynamics = [Dynamic.from_space_history(card) for card in data_data.get("cards") or []]
+        if not dynamics:
+            print("当前页没有动态数据, 结束下载。")
+            self.exhausted = True
+            return None, None
+        next_offset = None
+        if not data_data.get("has_more", False):
+            self.exhausted = True
+        elif not self.dynamic_processor.page_is_final(dynamics):
+            # 本页已到达截止日期或高水位线时不再请求下一页
+            if self.feed_space:
+                next_offset = data_data.get("offset") or dynamics[-1].dynamic_id
+            elif "next_offset" in data_data:
+                next_offset = data_data["next_offset"]
+            else:
+                next_offset = dynamics[-1].dynamic_id or 0
+        return dynamics, next_offset
+
+    def iter_pages(self):
+        """逐页请求并产出 Dynamic 列表, 请求节奏由限速器控制"""
+        offset = 0
+        while True:
+            dynamics, offset = self.fetch_page(offset)
+            if dynamics is None:
+                return
+            yield dynamics
+            if offset is None:
+                return
+
+    def iter_prefetched_pages(self, depth):
+        """
+        后台线程按 next_offset 预取下一页, 与当前页的下载重叠进行
+        :param depth: 队列中最多缓存的页数
+        """
+        page_queue = queue.Queue(maxsize=depth)
+        stop_event = threading.Event()
+        producer = threading.Thread(target=self._produce_pages, args=(page_queue, stop_event), daemon=True)
+        producer.start()
+        try:
+            while True:
+                dynamics = page_queue.get()
+                if dynamics is None:
+                    return
+                yield dynamics
+        finally:
+            # 消费端提前结束 (如到达截止日期) 时通知预取线程退出
+            stop_event.set()
+            producer.join()
+
+    def _produce_pages(self, page_queue, stop_event):
+        offset = 0
+        try:
+            while not stop_event.is_set():
+                dynamics, offset = self.fetch_page(offset)
+                if dynamics is None or not self._offer(page_queue, dynamics, stop_event):
+                    return
+                if offset is None:
+                    return
+        finally:
+            self._offer(page_queue, None, stop_event)
+
+    @staticmethod
+    def _offer(page_queue, item, stop_event):
+        """在队列有空位时放入 item, 被取消时返回 False"""
+        while not stop_event.is_set():
+            try:
+                page_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
 
     def run(self):
-        base_url = "https://api.vc.bilibili.com/dynamic_svr/v1/dynamic_svr/space_history"
-        params = {"host_uid": self.config.uid, "offset_dynamic_id": 0}
-        has_more = True
-        page_count = 1
+        prefetch_pages = int(self.config.settings.get("PREFETCH_PAGES", 1))
+        if prefetch_pages > 0:
+            pages = self.iter_prefetched_pages(prefetch_pages)
+        else:
+            pages = self.iter_pages()
 
+        metrics = self.config.http.metrics
+        start = time.perf_counter()
         try:
-            while has_more:
+            for page_count, dynamics in enumerate(pages, start=1):
                 print(f"正在处理第 {page_count} 页动态...")
-                try:
-                    response = requests.get(base_url, headers=self.dynamic_processor.downloader.headers, params=params, timeout=10)
-                    if response.status_code != 200:
-                        print("请求失败, 状态码:", response.status_code)
-                        break
-                    data = response.json()
-                    if data.get("code") != 0:
-                        print("接口返回错误信息:", data.get("message", ""))
-                        break
-                    data_data = data.get("data", {})
-                    cards = data_data.get("cards", [])
-                    has_more = data_data.get("has_more", False)
-                    if "next_offset" in data_data:
-                        params["offset_dynamic_id"] = data_data["next_offset"]
-                    elif cards:
-                        params["offset_dynamic_id"] = cards[-1].get("desc", {}).get("dynamic_id", 0)
-                    else:
-                        has_more = False
-
-                    if not cards:
-                        print("当前页没有动态数据, 结束下载。")
-                        break
-
-                    for dynamic in cards:
-                        self.dynamic_processor.process_dynamic(dynamic, self.success_list, self.failed_list)
-
-                    page_count += 1
-                    print(f"等待 {self.config.interval} 秒后继续下载下一页...")
-                    time.sleep(self.config.interval)
-                except StopIteration as e:
-                    print(e)
-                    break
+                with metrics.timer("spider.page"):
+                    if page_count == 1:
+                        # 须在处理本页之前判断, 处理后本页动态都会记为已保存
+                        self.dynamic_processor.seed_checkpoint(dynamics)
+                    for dynamic in dynamics:
+                        in_range = self.dynamic_processor.process_dynamic(dynamic, self.success_list, self.failed_list)
+                        # 越过截止日期时 process_dynamic 抛出 StopIteration, 该动态与早于截止日期的置顶动态都不抓评论区
+                        if in_range and self.on_dynamic is not None:
+                            self.on_dynamic(dynamic)
+                    # 每页的状态变更合并为一个事务写入
+                    with metrics.timer("state.flush"):
+                        self.file_manager.flush()
+            completed = self.exhausted
+        except StopIteration as e:
+            print(e)
+            completed = True
         finally:
-            date_list = self.file_manager.read_date_log_lines()
-            self.file_manager.write_sorted_date_log(date_list)
-            print("date.log 已排序并保存")
+            pages.close()
+            self.file_manager.flush()
+            metrics.observe("spider.run", time.perf_counter() - start)
+        # 只有衔接上已抓取的部分 (或翻到末尾) 时才推进高水位线, 中途出错则保留原值
+        newest = self.dynamic_processor.newest
+        if completed and newest:
+            if self.dynamic_processor.planner is not None:
+                # 计划模式中的动态还没下载, 高水位线等 merge 合并完成记录后再推进
+                self.file_manager.save_planned_checkpoint(*newest)
+                # 本次没有留下待下载的动态时可以直接生效
+                self.file_manager.promote_planned_checkpoint()
+            else:
+                self.file_manager.update_checkpoint(*newest)
 
 class RetryFailedUrls:
-    def __init__(self, config: Config, file_manager: FileManager, dynamic_processor: DynamicProcessor):
+    """
+    并发重试所有 UID 的失败动态, 请求经过全局限速器
+    状态库中的 failed 记录即重试队列: 每轮取出已到期的动态, 失败的按指数退避推迟, 永久错误或多次失败的转入死信
+    """
+    DETAIL_URL = "https://api.bilibili.com/x/polymer/web-dynamic/v1/detail"
+
+    def __init__(self, config: Config, downloader: Downloader):
         self.config = config
-        self.file_manager = file_manager
-        self.dynamic_processor = dynamic_processor
-        self.success_list = []
-        self.failed_list = []
-        self.headers = {
-            **dynamic_processor.downloader.headers,
-            "Referer": "https://t.bilibili.com/"
-        }
+        self.downloader = downloader
+        self.workers = max(1, int(config.settings.get("RETRY_WORKERS", 4)))
+        # 下一轮在这么多秒内到期时本次运行等待它, 更晚的留给下次运行
+        self.max_wait = float(config.settings.get("RETRY_MAX_WAIT", 60))
+        self.headers = {"Referer": "https://t.bilibili.com/"}
+        self.contexts = {}
 
-    def run(self):
+    def _context(self, uid):
+        """每个 UID 的 (FileManager, DynamicProcessor), 在主线程中创建"""
+        if uid not in self.contexts:
+            uid_config = self.config.for_uid(uid)
+            file_manager = FileManager(uid_config)
+            # retry 模式不按高水位线跳过, 早于高水位线的失败动态也要重新处理
+            dynamic_processor = DynamicProcessor(uid_config, file_manager, self.downloader, None, method='retry')
+            self.contexts[uid] = (file_manager, dynamic_processor)
+        return self.contexts[uid]
+
+    def retry_one(self, uid, dynamic_id):
+        """重新获取并处理一条动态, 返回是否成功"""
+        with self.config.http.metrics.timer("retry.one"):
+            return self._retry_one(uid, dynamic_id)
+
+    def _retry_one(self, uid, dynamic_id):
+        file_manager, dynamic_processor = self.contexts[uid]
+        url = f"https://t.bilibili.com/{dynamic_id}"
+        try:
+            detail_data = self.config.http.get_json(
+                self.DETAIL_URL, endpoint="detail", params={"id": dynamic_id}, headers=self.headers, timeout=10
+            )
+        except Exception as e:
+            print(f"重试URL {url} 发生异常: {e}")
+            if is_permanent_error(e):
+                file_manager.mark_dead(dynamic_id, str(e))
+            else:
+                file_manager.mark_failed(dynamic_id, str(e))
+            return False
+
+        code = detail_data.get('code')
+        if code != 0:
+            reason = f"code {code}: {detail_data.get('message')}"
+            print(f"重试URL {url} 失败: {reason}")
+            if code in PERMANENT_DETAIL_CODES:
+                file_manager.mark_dead(dynamic_id, reason)
+            else:
+                file_manager.mark_failed(dynamic_id, reason)
+            return False
+        item = (detail_data.get('data') or {}).get('item')
+        if not item:
+            print(f"重试URL {url} 失败: 详情为空")
+            file_manager.mark_dead(dynamic_id, "详情为空")
+            return False
+
+        success_list, failed_list = [], []
+        dynamic_processor.process_dynamic(Dynamic.from_detail(item), success_list, failed_list)
+        if not success_list and not failed_list:
+            # 缺少发布时间等无法处理的动态也记一次失败, 否则下一轮会被立即再次取出
+            file_manager.mark_failed(dynamic_id, "动态数据不完整")
+        return bool(success_list)
+
+    def run(self, uid_list):
         print("\n开始重试未成功下载的URL...")
-        unsaved_urls = self.file_manager.load_url_set(self.config.unsaved_url_filename)
-        if not unsaved_urls:
-            print("没有需要重试的URL")
-            return
-        print(f"发现 {len(unsaved_urls)} 条待重试URL")
-        
+        uid_list = list(uid_list)
+        attempted = succeeded = 0
+        round_num = 0
         still_failed = set()
-        success_count = 0
-        
-        for url in unsaved_urls:
-            time.sleep(random.uniform(1.0, 2.0))
-            dynamic_id = url.split("/")[-1].split("?")[0]
-            if not dynamic_id.isdigit():
-                still_failed.add(url)
-                continue
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                jobs = [(uid, dynamic_id) for uid in uid_list for dynamic_id, _ in self.config.state.due_retries(uid)]
+                if jobs:
+                    round_num += 1
+                    round_start = time.perf_counter()
+                    print(f"第 {round_num} 轮重试: {len(jobs)} 条")
+                    for uid in {uid for uid, _ in jobs}:
+                        self._context(uid)
+                    futures = {pool.submit(self.retry_one, uid, dynamic_id): (uid, dynamic_id) for uid, dynamic_id in jobs}
+                    for future in as_completed(futures):
+                        uid, dynamic_id = futures[future]
+                        url = f"https://t.bilibili.com/{dynamic_id}"
+                        attempted += 1
+                        try:
+                            ok = future.result()
+                        except Exception as e:
+                            print(f"重试URL {url} 出错: {e}")
+                            self.contexts[uid][0].mark_failed(dynamic_id, str(e))
+                            ok = False
+                        if ok:
+                            succeeded += 1
+                            still_failed.discard(url)
+                        else:
+                            still_failed.add(url)
+                    # 一轮的结果合并为一个事务写入, 写入时安排失败动态的下次重试时间
+                    self.config.state.flush()
+                    self.config.catalog.flush()
+                    self.config.http.metrics.observe("retry.round", time.perf_counter() - round_start)
 
-            api_url = f"https://api.bilibili.com/x/polymer/web-dynamic/v1/detail?id={dynamic_id}"
-            try:
-                res = requests.get(api_url, headers=self.headers, timeout=10)
-                detail_data = res.json()
-                if detail_data.get('code') == 0:
-                    item = detail_data.get('data', {}).get('item', {})
-                    if not item:
-                         still_failed.add(url)
-                         continue
-                    
-                    # 模拟 space_history 的格式
-                    dynamic_card = {
-                        "desc": item.get('desc'), 
-                        "card": item.get('card') # card在这里是dict, process_dynamic需要str
-                    }
-                    # 修正：DynamicProcessor 需要 card 是一个字符串
-                    dynamic_card['card'] = json.dumps(dynamic_card['card'], ensure_ascii=False)
-                    
-                    self.dynamic_processor.process_dynamic(dynamic_card, self.success_list, self.failed_list)
-                    success_count += 1
-                else:
-                    print(f"重试URL {url} 失败: {detail_data.get('message')}")
-                    still_failed.add(url)
-            except Exception as e:
-                print(f"重试URL {url} 发生异常: {e}")
-                still_failed.add(url)
-        
-        self.file_manager.write_url_file(self.config.unsaved_url_filename, list(still_failed))
+                next_at = self.config.state.next_retry_at(uid_list)
+                if next_at is None:
+                    break
+                wait = next_at - time.time()
+                if wait > self.max_wait:
+                    print(f"其余失败动态最早于 {datetime.datetime.fromtimestamp(next_at):%m-%d %H:%M} 到期, 留待下次重试")
+                    break
+                if wait > 0:
+                    print(f"等待 {wait:.0f} 秒后开始下一轮重试")
+                    self.config.http.metrics.add_sleep("retry_backoff", wait)
+                    time.sleep(wait)
+
+        if not attempted:
+            print("没有需要重试的URL")
+            return
         print(f"\n{'='*30}")
-        print(f"重试完成! 成功 {success_count}/{len(unsaved_urls)} 条")
+        print(f"重试完成! 成功 {succeeded}/{attempted} 次")
+        pending = self.config.state.count_status(uid_list, STATUS_FAILED)
+        dead = self.config.state.count_status(uid_list, STATUS_DEAD)
+        print(f"待重试 {pending} 条, 已放弃 (永久错误或多次失败) {dead} 条")
         if still_failed:
-            print(f"以下 {len(still_failed)} 个URL仍然失败:\n" + "\n".join(still_failed))
+            print(f"以下 {len(still_failed)} 个URL本次仍然失败:\n" + "\n".join(sorted(still_failed)))
+
 
+class CrawlScheduler:
+    """并行抓取多个 UID, 所有请求共享 HttpClient 的全局限速与 Downloader 的下载池"""
+    def __init__(self, config: Config, downloader: Downloader, method: str, comments=None, planner=None):
+        """
+        :param comments: bili_comment.MainController, 给出时为合并抓取: 用 feed/space 列出一次动态,
+                         每条动态同时保存动态图片并抓取评论区图片 (存入用户目录下的 comments 文件夹)
+        :param planner: ManifestWriter, 给出时只把图片任务写入清单, 不下载
+        """
+        self.config = config
+        self.downloader = downloader
+        self.method = method
+        self.comments = comments
+        self.planner = planner
+        self.workers = max(1, int(config.settings.get("UID_WORKERS", 3)))
+
+    COMMENT_DIR = "comments"
+
+    @classmethod
+    def combined(cls, config: Config, downloader: Downloader, method: str):
+        """
+        合并抓取: 评论区抓取与动态图片共用 HttpClient (限速器)、状态库、内容仓库与后处理进程池
+        评论区的线程数、冻结天数等取自 config.json 的 COMMENT_SETTINGS, 未给出的沿用 bili_comment.Config
+        """
+        bili_comment.Config.update(config.settings.get("COMMENT_SETTINGS"))
+        comment_downloader = bili_comment.ImageDownloader(config.http, config.state, config.base_dir, shared=downloader)
+        comments = bili_comment.MainController(config.http, config.state, comment_downloader)
+        return cls(config, downloader, method, comments=comments)
+
+    def crawl_uid(self, uid):
+        """抓取单个 UID, 返回 (成功动态数, 失败动态数)"""
+        uid_config = self.config.for_uid(uid)
+        print(f"\n{'='*20}\n开始下载UID: {uid} ({uid_config.username})\n{'='*20}")
+        file_manager = FileManager(uid_config)
+        date_log_num = file_manager.read_date_log()
+        dynamic_processor = DynamicProcessor(uid_config, file_manager, self.downloader, date_log_num, self.method, self.planner)
+        on_dynamic = None
+        if self.comments is not None:
+            comment_dir = os.path.join(uid_config.download_dir, self.COMMENT_DIR)
+            on_dynamic = lambda dynamic: self.comments.submit(dynamic, comment_dir)
+        spider = BilibiliDynamicSpider(uid_config, file_manager, dynamic_processor,
+                                       feed_space=self.comments is not None, on_dynamic=on_dynamic)
+        spider.run()
+        print(f"\n用户 {uid} 下载完成\n")
+        return len(spider.success_list), len(spider.failed_list)
+
+    def run(self, uid_list):
+        start = time.monotonic()
+        files_before = self.downloader.saved_files
+        bytes_before = self.downloader.saved_bytes
+        success_total = failed_total = 0
+        finished_uids = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.crawl_uid, uid): uid for uid in uid_list}
+            for future in as_completed(futures):
+                uid = futures[future]
+                try:
+                    success, failed = future.result()
+                except Exception as e:
+                    print(f"UID {uid} 抓取出错: {e}")
+                    continue
+                finished_uids += 1
+                success_total += success
+                failed_total += failed
+        if self.comments is not None:
+            # 评论区抓取在共用的线程池中进行, 等它们全部结束再统计
+            self.comments.finish()
+
+        elapsed = max(time.monotonic() - start, 1e-6)
+        files = self.downloader.saved_files - files_before
+        size_mb = (self.downloader.saved_bytes - bytes_before) / 1024 / 1024
+        print(f"\n{'='*30}")
+        print(f"全部抓取完成: {finished_uids}/{len(uid_list)} 个用户, 并发 {self.workers}, 耗时 {elapsed:.1f} 秒")
+        print(f"动态: 成功 {success_total}, 失败 {failed_total}, {success_total / elapsed:.2f} 条/秒")
+        print(f"图片: {files} 张, {size_mb:.1f} MB, {files / elapsed:.2f} 张/秒, {size_mb / elapsed:.2f} MB/秒")
+        if self.comments is not None:
+            self.comments.progress.report()
+
+class WatchScheduler:
+    """
+    常驻运行, 按每个 UID 的发帖频率安排轮询: 常发动态的用户勤查, 久不更新的用户少查
+    HttpClient、限速器与状态库在各轮之间保持不变
+    """
+    def __init__(self, config: Config, downloader: Downloader):
+        self.config = config
+        self.downloader = downloader
+        self.scheduler = CrawlScheduler(config, downloader, method='url')
+        # 轮询间隔 = 平均发帖间隔 * WATCH_POLL_FACTOR, 限制在 [WATCH_MIN_INTERVAL, WATCH_MAX_INTERVAL] 秒之间
+        self.min_interval = float(config.settings.get("WATCH_MIN_INTERVAL", 600))
+        self.max_interval = float(config.settings.get("WATCH_MAX_INTERVAL", 86400))
+        self.poll_factor = float(config.settings.get("WATCH_POLL_FACTOR", 0.25))
+        self.next_poll = {}
+
+    def poll_interval(self, uid, now=None):
+        """按最近的发布时间 (已保存的动态与导入的 date.log) 估计平均发帖间隔, 没有记录时取最短与最长间隔的几何平均"""
+        now = now or time.time()
+        time_nums = self.config.state.recent_time_nums(uid)
+        if not time_nums:
+            return (self.min_interval * self.max_interval) ** 0.5
+        # 以当前时间为终点, 长期不发帖的用户平均间隔会随之变长
+        span = max(now - Utils.num_to_timestamp(time_nums[-1]), 0)
+        interval = span / len(time_nums) * self.poll_factor
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _schedule(self, uid, now):
+        # 加一点抖动, 避免多个 UID 总在同一时刻到期
+        interval = self.poll_interval(uid, now) * random.uniform(0.9, 1.1)
+        self.next_poll[uid] = now + interval
+        return interval
+
+    def run(self):
+        print(f"进入监视模式, 共 {len(self.config.uid_list)} 个用户, 按 Ctrl+C 退出")
+        try:
+            while True:
+                uid_list = list(self.config.uid_list)
+                now = time.time()
+                due = [uid for uid in uid_list if self.next_poll.get(uid, 0) <= now]
+                if due:
+                    self.scheduler.run(due)
+                    now = time.time()
+                    for uid in due:
+                        interval = self._schedule(uid, now)
+                        print(f"UID {uid} 下次检查: {interval / 60:.0f} 分钟后")
+                    # 顺带处理已到期的失败重试
+                    next_retry = self.config.state.next_retry_at(uid_list)
+                    if next_retry is not None and next_retry <= now:
+                        RetryFailedUrls(self.config, self.downloader).run(uid_list)
+                wait = min(self.next_poll.get(uid, 0) for uid in uid_list) - time.time() if uid_list else self.max_interval
+                if wait > 0:
+                    print(f"等待 {wait / 60:.1f} 分钟后进行下一次检查")
+                    self.config.http.metrics.add_sleep("watch_idle", wait)
+                    time.sleep(wait)
+        except KeyboardInterrupt:
+            print("退出监视模式")
 
 class OperationMenu:
     def __init__(self, config: Config, downloader: Downloader):
@@ -481,40 +1076,30 @@ class OperationMenu:
                 "1. 开始新抓取\n"
                 "2. 重试失败URL\n"
                 "3. 退出\n"
-                "4. (从config.json)重新加载UID列表\n请输入数字: "
+                "4. (从config.json)重新加载UID列表\n"
+                "5. 合并抓取 (一次遍历同时下载动态图片与评论区图片)\n请输入数字: "
             ).strip()
-            if choice == "1":
+            if choice in ("1", "5"):
                 method_choice = input(
                     "请选择保存方法:\n"
-                    "1. 使用 date.log 截止日期停止 (推荐)\n"
-                    "2. 检查 saved_url.txt，直到获取到已保存的URL\n"
+                    "1. 使用已保存动态的最新发布时间作为截止日期停止 (推荐)\n"
+                    "2. 检查已保存记录，跳过已保存的动态\n"
                     "请输入数字: "
                 ).strip()
                 method = 'date' if method_choice == "1" else 'url'
                 
-                for uid in self.config.uid_list:
-                    print(f"\n{'='*20}\n开始下载UID: {uid} ({self.config.get_username(uid)})\n{'='*20}")
-                    self.config.update_for_uid(uid)
-                    file_manager = FileManager(self.config)
-                    date_log_num = file_manager.read_date_log()
-                    saved_url_set = file_manager.load_url_set(self.config.saved_url_filename)
-                    dynamic_processor = DynamicProcessor(self.config, file_manager, self.downloader, saved_url_set, date_log_num, method)
-                    spider = BilibiliDynamicSpider(self.config, file_manager, dynamic_processor)
-                    spider.run()
-                    long_interval = self.config.settings.get("LONG_LONG_INTERVAL", 1200) / len(self.config.uid_list)
-                    long_interval = min(max(long_interval, 3.0), 30.0)
-                    print(f"\n用户 {uid} 下载完成，暂停 {long_interval:.2f} 秒\n")
-                    time.sleep(long_interval)
+                if choice == "5":
+                    scheduler = CrawlScheduler.combined(self.config, self.downloader, method)
+                else:
+                    scheduler = CrawlScheduler(self.config, self.downloader, method)
+                scheduler.run(self.config.uid_list)
+                self.downloader.print_stats()
+                self.config.http.print_stats()
             elif choice == "2":
-                for uid in self.config.uid_list:
-                    print(f"\n{'='*20}\n重试UID: {uid} 的失败URL\n{'='*20}")
-                    self.config.update_for_uid(uid)
-                    file_manager = FileManager(self.config)
-                    date_log_num = None 
-                    saved_url_set = file_manager.load_url_set(self.config.saved_url_filename)
-                    dynamic_processor = DynamicProcessor(self.config, file_manager, self.downloader, saved_url_set, date_log_num, method='url')
-                    retry = RetryFailedUrls(self.config, file_manager, dynamic_processor)
-                    retry.run()
+                retry = RetryFailedUrls(self.config, self.downloader)
+                retry.run(self.config.uid_list)
+                self.downloader.print_stats()
+                self.config.http.print_stats()
             elif choice == "3":
                 print("程序退出")
                 break
@@ -526,11 +1111,55 @@ class OperationMenu:
                 print("无效输入，请重新选择")
 
 def main():
+    parser = argparse.ArgumentParser(description="下载B站用户动态中的图片")
+    parser.add_argument("--watch", action="store_true", help="常驻运行, 按各用户的发帖频率自动轮询, 不显示菜单")
+    parser.add_argument("--profile", metavar="PATH", help="用 cProfile 分析主线程, 结果写入 PATH")
+    parser.add_argument("--base-url", help="把B站接口与图片请求改发到这个地址, 如本地模拟服务器 http://127.0.0.1:8765")
+    manifest = parser.add_mutually_exclusive_group()
+    manifest.add_argument("--plan", metavar="MANIFEST", help="计划模式: 抓取动态列表, 把待下载的图片任务追加到清单文件, 不下载")
+    manifest.add_argument("--execute", metavar="MANIFEST", help="执行模式: 下载清单中的图片, 可用 --shard 或 --range 只取一部分")
+    manifest.add_argument("--merge", metavar="MANIFEST", help="把清单的完成记录 (MANIFEST.done-*.jsonl) 合并进状态库")
+    parser.add_argument("--shard", type=parse_shard, metavar="I/N", help="执行模式下只处理 hash(UID) %% N == I 的任务")
+    parser.add_argument("--range", type=parse_range, metavar="START:STOP", help="执行模式下只处理清单第 START 到 STOP-1 行")
+    args = parser.parse_args()
+
     app_settings = load_config()
+    if args.base_url:
+        app_settings["BASE_URL"] = args.base_url
     config = Config(app_settings)
     downloader = Downloader(config)
-    menu = OperationMenu(config, downloader)
-    menu.run()
+    try:
+        with profiled(args.profile):
+            if args.watch:
+                WatchScheduler(config, downloader).run()
+            elif args.plan:
+                planner = ManifestWriter(args.plan, config.base_dir)
+                try:
+                    CrawlScheduler(config, downloader, 'url', planner=planner).run(config.uid_list)
+                finally:
+                    planner.close()
+            elif args.execute:
+                ManifestExecutor(downloader, config.base_dir).run(args.execute, args.shard, args.range)
+                downloader.print_stats()
+                config.http.print_stats()
+            elif args.merge:
+                merge_done(config.state, args.merge, config.catalog)
+            else:
+                OperationMenu(config, downloader).run()
+    finally:
+        downloader.close()
+        config.http.close()
+        config.state.close()
+        config.catalog.close()
+        # REPORT_DIR 为空字符串时不写运行报告
+        report_dir = app_settings.get("REPORT_DIR", os.path.join(config.base_dir, "reports"))
+        if report_dir:
+            config.http.metrics.write_report(report_dir, "bili_dynamic", {
+                "saved_files": downloader.saved_files,
+                "saved_bytes": downloader.saved_bytes,
+                "skipped_files": downloader.skipped_files,
+                "throttled": {endpoint: bucket.throttled for endpoint, bucket in config.http.limiter.buckets.items() if bucket.throttled},
+            })
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
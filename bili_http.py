@@ -0,0 +1,221 @@
+import os
+import re
+import time
+import requests
+from urllib.parse import urlsplit, urlunsplit
+from requests.adapters import HTTPAdapter
+from bili_metrics import Metrics
+from bili_ratelimit import RateLimiter
+
+# 所有请求共用的浏览器标识
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36 Edg/122.0.0.0"
+DEFAULT_REFERER = "https://www.bilibili.com/"
+
+CONTENT_RANGE_PATTERN = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+class IncompleteDownload(IOError):
+    """下载的字节数与服务器声明的长度不一致"""
+
+# base_url 生效时改写到 base_url 的主机后缀
+REWRITE_HOST_SUFFIXES = ("bilibili.com", "hdslb.com")
+
+# 为这些主机单独维护 keep-alive 连接池
+POOLED_HOSTS = (
+    "api.bilibili.com",
+    "api.vc.bilibili.com",
+    "i0.hdslb.com",
+    "i1.hdslb.com",
+    "i2.hdslb.com",
+)
+
+class HttpClient:
+    """bili_dynamic 与 bili_comment 共用的 HTTP 客户端，按主机复用连接"""
+    def __init__(self, cookie="", pool_maxsize=10, host_pool_sizes=None, limiter=None, throttle_retries=2, metrics=None,
+                 base_url=None):
+        """
+        :param cookie: B站登录 Cookie
+        :param pool_maxsize: 每个主机连接池保留的最大连接数
+        :param host_pool_sizes: 按主机覆盖连接池大小, 如 {"i0.hdslb.com": 4}
+        :param limiter: 共享的 RateLimiter, 为空时使用默认速率
+        :param throttle_retries: 被限流后退避重试的次数
+        :param metrics: 共享的 Metrics, 记录请求耗时、状态码、字节数与限速等待
+        :param base_url: 把B站接口与图片请求改发到这个地址 (保留路径与参数), 用于连接本地模拟服务器
+        """
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.limiter = limiter or RateLimiter()
+        self.metrics = metrics or Metrics()
+        self.throttle_retries = throttle_retries
+        self.session = requests.Session()
+        self.session.headers.update({
+            "User-Agent": USER_AGENT,
+            "Referer": DEFAULT_REFERER,
+        })
+        if cookie:
+            self.session.headers["Cookie"] = cookie
+
+        host_pool_sizes = host_pool_sizes or {}
+        self.adapters = {}
+        for host in POOLED_HOSTS:
+            self.mount(host, host_pool_sizes.get(host, pool_maxsize))
+        # 其余主机共用一个默认适配器
+        default_adapter = HTTPAdapter(pool_maxsize=pool_maxsize)
+        self.session.mount("https://", default_adapter)
+        self.session.mount("http://", default_adapter)
+        self.adapters["*"] = default_adapter
+
+    def mount(self, host, pool_maxsize):
+        """为指定主机挂载独立的连接池"""
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize)
+        self.session.mount(f"https://{host}/", adapter)
+        self.session.mount(f"http://{host}/", adapter)
+        self.adapters[host] = adapter
+
+    def get(self, url, endpoint=None, **kwargs):
+        """
+        发送 GET 请求, 额外的 headers 会与公共请求头合并
+        :param endpoint: 接口类别 (如 "image"), 指定后请求经过限速器, 被限流时自动退避重试
+        """
+        return self.request("GET", url, endpoint, **kwargs)
+
+    def head(self, url, endpoint=None, **kwargs):
+        """发送 HEAD 请求, 用于不下载内容地检查文件大小"""
+        kwargs.setdefault("allow_redirects", True)
+        return self.request("HEAD", url, endpoint, **kwargs)
+
+    def _acquire(self, endpoint):
+        if endpoint:
+            self.metrics.add_sleep(f"ratelimit.{endpoint}", self.limiter.acquire(endpoint))
+
+    def rewrite(self, url):
+        """设置了 base_url 时把B站主机的地址改写为 base_url + 原路径"""
+        if not self.base_url:
+            return url
+        parts = urlsplit(url)
+        if not parts.netloc.endswith(REWRITE_HOST_SUFFIXES):
+            return url
+        return self.base_url + urlunsplit(("", "", parts.path, parts.query, ""))
+
+    def _send(self, method, url, endpoint, **kwargs):
+        """发送一次请求并记录耗时 (到收到响应头为止) 与状态码"""
+        url = self.rewrite(url)
+        with self.metrics.timer(f"http.{endpoint or 'other'}"):
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                self.metrics.count_request(endpoint, type(e).__name__)
+                raise
+        self.metrics.count_request(endpoint, response.status_code)
+        return response
+
+    def request(self, method, url, endpoint=None, **kwargs):
+        kwargs.setdefault("timeout", 10)
+        for attempt in range(self.throttle_retries + 1):
+            self._acquire(endpoint)
+            response = self._send(method, url, endpoint, **kwargs)
+            if not endpoint or not self.limiter.report(endpoint, response.status_code):
+                return response
+            if attempt == self.throttle_retries:
+                return response
+            print(f"{endpoint} 接口触发限流 (HTTP {response.status_code}), 退避后重试")
+            response.close()
+
+    def get_json(self, url, endpoint=None, **kwargs):
+        """
+        请求 JSON 接口, 除 HTTP 状态码外还会识别B站风控返回码
+        :return: 解析后的 JSON; 状态码非 2xx 时抛出 requests.HTTPError
+        """
+        kwargs.setdefault("timeout", 10)
+        for attempt in range(self.throttle_retries + 1):
+            self._acquire(endpoint)
+            response = self._send("GET", url, endpoint, **kwargs)
+            data = response.json() if response.ok else None
+            api_code = data.get("code", 0) if isinstance(data, dict) else 0
+            throttled = endpoint and self.limiter.report(endpoint, response.status_code, api_code)
+            if not throttled or attempt == self.throttle_retries:
+                response.raise_for_status()
+                return data
+            print(f"{endpoint} 接口触发风控 (HTTP {response.status_code}, code {api_code}), 退避后重试")
+
+    def download(self, url, filepath, endpoint="image", chunk_size=65536, timeout=10):
+        """
+        断点续传下载: 写入 filepath + ".part", 已有 .part 时用 Range 请求续传,
+        长度与 Content-Length 一致后再原子地重命名为 filepath
+        :return: 本次写入的字节数; 失败时抛出异常并保留 .part 供下次续传
+        """
+        part_path = filepath + ".part"
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        response = self.get(url, endpoint=endpoint, headers=headers, stream=True, timeout=timeout)
+        with response:
+            if response.status_code == 416:
+                # 服务器无法满足续传范围, 丢弃 .part 下次从头下载; 没有 .part 时无需清理
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise IncompleteDownload(f"无法续传 {url}, 已丢弃临时文件")
+            response.raise_for_status()
+
+            expected = None
+            if response.status_code == 206:
+                match = CONTENT_RANGE_PATTERN.match(response.headers.get("Content-Range", ""))
+                if not match or int(match.group(1)) != offset:
+                    # 206 的内容只是片段, 起点与 .part 对不上时既不能续写也不能当作完整文件
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                    raise IncompleteDownload(f"{url} 返回的续传范围与本地不符, 已丢弃临时文件")
+                mode = "ab"
+                expected = int(match.group(3))
+            elif response.status_code != 200:
+                raise IncompleteDownload(f"{url} 返回了意外的状态码 {response.status_code}")
+            else:
+                # 200 为完整内容, 服务器忽略了 Range 时从头写入
+                offset = 0
+                mode = "wb"
+                if "Content-Length" in response.headers and "Content-Encoding" not in response.headers:
+                    expected = int(response.headers["Content-Length"])
+
+            written = 0
+            disk_time = 0.0
+            start = time.perf_counter()
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size):
+                    write_start = time.perf_counter()
+                    f.write(chunk)
+                    disk_time += time.perf_counter() - write_start
+                    written += len(chunk)
+            self.metrics.observe(f"transfer.{endpoint}", time.perf_counter() - start)
+            self.metrics.observe("disk_write", disk_time)
+            self.metrics.add_bytes(f"transfer.{endpoint}", written)
+
+        if expected is not None and offset + written != expected:
+            raise IncompleteDownload(f"{url} 只下载了 {offset + written}/{expected} 字节")
+        os.replace(part_path, filepath)
+        return written
+
+    def stats(self):
+        """
+        统计各主机的连接复用情况
+        :return: {host: (请求数, 新建连接数)}
+        """
+        result = {}
+        for adapter in self.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                requests_made, connections = result.get(pool.host, (0, 0))
+                result[pool.host] = (requests_made + pool.num_requests, connections + pool.num_connections)
+        return result
+
+    def print_stats(self):
+        stats = self.stats()
+        if stats:
+            print("连接复用统计:")
+            for host, (requests_made, connections) in sorted(stats.items()):
+                reused = max(requests_made - connections, 0)
+                ratio = reused / requests_made if requests_made else 0
+                print(f" - {host}: 请求 {requests_made} 次, 新建连接 {connections} 个, 复用率 {ratio:.0%}")
+        self.limiter.print_stats()
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,194 @@
+import glob
+import json
+import os
+import threading
+import zlib
+from bili_state import STATUS_PLANNED
+
+class ManifestWriter:
+    """
+    计划模式: 把每条动态待下载的图片写入 JSON Lines 任务清单, 不下载任何图片
+    每行一个任务 {"uid", "dynamic_id", "time_num", "timestamp", "url", "path"}, path 为相对于 base_dir 的路径 (以 / 分隔),
+    行号即任务编号, 清单只追加不修改
+    """
+    def __init__(self, path, base_dir):
+        self.path = path
+        self.base_dir = base_dir
+        self.lock = threading.Lock()
+        self.jobs = 0
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def add(self, uid, dynamic_id, time_num, timestamp, jobs):
+        """
+        :param jobs: [(url, 本地完整路径)], 图片与该动态的 info.txt 在同一文件夹
+        """
+        lines = [
+            json.dumps({
+                "uid": uid,
+                "dynamic_id": dynamic_id,
+                "time_num": time_num,
+                "timestamp": timestamp,
+                "url": url,
+                "path": os.path.relpath(filepath, self.base_dir).replace(os.sep, "/"),
+            }, ensure_ascii=False) + "\n"
+            for url, filepath in jobs
+        ]
+        with self.lock:
+            self.file.writelines(lines)
+            self.file.flush()
+            self.jobs += len(lines)
+
+    def close(self):
+        self.file.close()
+        print(f"任务清单已写入: {self.path} (本次新增 {self.jobs} 个图片任务)")
+
+def shard_of(uid, shards):
+    """按 UID 的稳定哈希分片, 同一用户的任务总在同一分片"""
+    return zlib.crc32(str(uid).encode("utf-8")) % shards
+
+def parse_shard(text):
+    """ "i/n" -> (i, n), i 从 0 开始 """
+    index, _, count = text.partition("/")
+    index, count = int(index), int(count)
+    if count <= 0 or not 0 <= index < count:
+        raise ValueError(f"无效的分片: {text}, 应为 i/n 且 0 <= i < n")
+    return index, count
+
+def parse_range(text):
+    """ "start:stop" -> (start, stop), 按清单行号 (从 0 开始) 取左闭右开区间, 任一端可省略 """
+    start, _, stop = text.partition(":")
+    return int(start or 0), (int(stop) if stop else None)
+
+def read_jobs(path, shard=None, line_range=None):
+    """
+    读取任务清单
+    :param shard: (i, n), 只取 shard_of(uid, n) == i 的任务
+    :param line_range: (start, stop), 只取行号在区间内的任务
+    :return: 生成 (行号, 任务)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f):
+            if line_range and (line_no < line_range[0] or (line_range[1] is not None and line_no >= line_range[1])):
+                continue
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            if shard and shard_of(job["uid"], shard[1]) != shard[0]:
+                continue
+            yield line_no, job
+
+def done_path(manifest_path, shard=None, line_range=None):
+    """执行端完成记录的文件名, 每个分片一个, 便于各主机分别写入后一起拷回"""
+    if shard:
+        label = f"shard{shard[0]}of{shard[1]}"
+    elif line_range:
+        label = f"lines{line_range[0]}-{'' if line_range[1] is None else line_range[1]}"
+    else:
+        label = "all"
+    return f"{manifest_path}.done-{label}.jsonl"
+
+def _read_done(path):
+    """完成记录 {行号: 记录}, 同一任务记录多次时以最后一次为准"""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                records[record["line"]] = record
+    return records
+
+class ManifestExecutor:
+    """
+    执行模式: 下载任务清单中的一个分片, 每个任务完成后追加一条完成记录 {"line", "ok", "size", ...}
+    图片按 path 写入本机的 base_dir, 重新运行时跳过已成功的任务
+    """
+    def __init__(self, downloader, base_dir, batch_size=64):
+        """
+        :param downloader: bili_dynamic.Downloader, 沿用其并发下载、限速、断点续传与去重
+        :param batch_size: 每批提交给下载池的任务数, 每批结束后写入完成记录
+        """
+        self.downloader = downloader
+        self.base_dir = base_dir
+        self.batch_size = batch_size
+
+    def local_path(self, job):
+        return os.path.join(self.base_dir, *job["path"].split("/"))
+
+    def run(self, manifest_path, shard=None, line_range=None):
+        """:return: (成功数, 失败数)"""
+        output = done_path(manifest_path, shard, line_range)
+        finished = {line for line, record in _read_done(output).items() if record["ok"]}
+        pending = [(line, job) for line, job in read_jobs(manifest_path, shard, line_range) if line not in finished]
+        print(f"分片共 {len(pending) + len(finished)} 个任务, 已完成 {len(finished)}, 待下载 {len(pending)}")
+        ok_count = failed_count = 0
+        with open(output, 'a', encoding='utf-8') as f:
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                for _, job in batch:
+                    os.makedirs(os.path.dirname(self.local_path(job)), exist_ok=True)
+                results = self.downloader.download_many([(job["url"], self.local_path(job)) for _, job in batch])
+                for (line, job), (_, filepath, ok) in zip(batch, results):
+                    size = os.path.getsize(filepath) if ok and os.path.isfile(filepath) else None
+                    f.write(json.dumps(dict(job, line=line, ok=ok, size=size), ensure_ascii=False) + "\n")
+                    if ok:
+                        ok_count += 1
+                    else:
+                        failed_count += 1
+                f.flush()
+                self.downloader.config.state.flush()
+        print(f"完成记录已写入: {output} (成功 {ok_count}, 失败 {failed_count})")
+        return ok_count, failed_count
+
+def merge_done(state, manifest_path, catalog=None):
+    """
+    把各执行端拷回的完成记录 (<清单>.done-*.jsonl) 合并进状态库:
+    一条动态的所有任务都有记录时, 全部成功记为 saved 并登记图片清单与动态目录, 否则记为 failed 进入重试队列;
+    仍有任务未执行的动态保持 planned, 已不是 planned 的动态 (合并过或已重试) 不再改动, 可重复合并
+    某个 UID 不再有 planned 动态后, 计划模式记下的高水位线才生效
+    :param catalog: bili_catalog.Catalog, 给出时为 saved 的动态添加目录条目
+    :return: (saved, failed, planned) 动态数
+    """
+    records = {}
+    for path in sorted(glob.glob(glob.escape(manifest_path) + ".done-*.jsonl")):
+        records.update(_read_done(path))
+
+    dynamics = {}
+    for line, job in read_jobs(manifest_path):
+        dynamics.setdefault((job["uid"], job["dynamic_id"]), []).append((line, job))
+
+    saved = failed = planned = 0
+    for (uid, dynamic_id), jobs in dynamics.items():
+        if state.status(uid, dynamic_id) != STATUS_PLANNED:
+            continue
+        done = [records.get(line) for line, _ in jobs]
+        if any(record is None for record in done):
+            planned += 1
+            continue
+        time_num = jobs[0][1].get("time_num")
+        failed_jobs = [record for record in done if not record["ok"]]
+        if failed_jobs:
+            state.mark_failed(uid, dynamic_id, f"{len(failed_jobs)}/{len(done)} 张图片下载失败", time_num)
+            failed += 1
+        else:
+            state.mark_saved(uid, dynamic_id, time_num)
+            saved += 1
+            if catalog is not None:
+                relpath = os.path.join(*jobs[0][1]["path"].split("/"))
+                info_path = os.path.join(catalog.base_dir, os.path.dirname(relpath), "info.txt")
+                known_sizes = {
+                    os.path.join(catalog.base_dir, *record["path"].split("/")): record["size"] for record in done
+                }
+                catalog.add_folder(uid, dynamic_id, jobs[0][1].get("timestamp"), info_path, known_sizes)
+        for record in done:
+            if record["ok"] and record.get("size") is not None:
+                state.record_file(os.path.join(*record["path"].split("/")), record["url"], record["size"])
+    state.flush()
+    if catalog is not None:
+        catalog.flush()
+    for uid in {uid for uid, _ in dynamics}:
+        if state.promote_planned_checkpoint(uid):
+            print(f"UID {uid} 的计划已全部合并, 高水位线已推进")
+    print(f"合并完成: saved {saved}, failed {failed}, 仍待执行 {planned} 条动态")
+    return saved, failed, planned
@@ -0,0 +1,147 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# 耗时直方图的桶上界 (秒), 最后一个桶收纳更慢的样本
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """按桶估计分位数, 返回所在桶的上界"""
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total": round(self.total, 3),
+            "mean": round(self.total / self.count, 4) if self.count else 0,
+            "p50": round(self.quantile(0.5), 4),
+            "p95": round(self.quantile(0.95), 4),
+            "max": round(self.max, 4),
+            "buckets": {("inf" if bound == float("inf") else str(bound)): count
+                        for bound, count in zip(BUCKETS, self.counts) if count},
+        }
+
+class Metrics:
+    """
+    一次运行的性能统计: 各阶段耗时直方图、按接口与状态码的请求数、传输字节数与限速等待时间
+    由 HttpClient 持有, 与限速器一样在两个爬虫的各组件之间共享
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.requests = {}
+        self.bytes = {}
+        self.sleep = {}
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = Histogram()
+            self.stages[stage].add(seconds)
+
+    def count_request(self, endpoint, status):
+        with self.lock:
+            by_status = self.requests.setdefault(endpoint or "other", {})
+            by_status[str(status)] = by_status.get(str(status), 0) + 1
+
+    def add_bytes(self, stage, size):
+        with self.lock:
+            self.bytes[stage] = self.bytes.get(stage, 0) + size
+
+    def add_sleep(self, reason, seconds):
+        if seconds <= 0:
+            return
+        with self.lock:
+            self.sleep[reason] = self.sleep.get(reason, 0.0) + seconds
+
+    def report(self, extra=None):
+        """
+        :param extra: 附加到报告中的计数, 如下载的文件数
+        :return: 可直接写成 JSON 的 dict
+        """
+        elapsed = max(time.time() - self.started, 1e-6)
+        with self.lock:
+            stages = {stage: histogram.to_dict() for stage, histogram in sorted(self.stages.items())}
+            transferred = {
+                stage: {"bytes": size, "bytes_per_sec": round(size / elapsed, 1)}
+                for stage, size in sorted(self.bytes.items())
+            }
+            # 各阶段累计处理时间内的吞吐量, 排除了空闲等待
+            for stage, entry in transferred.items():
+                if stage in self.stages and self.stages[stage].total:
+                    entry["bytes_per_busy_sec"] = round(entry["bytes"] / self.stages[stage].total, 1)
+            return {
+                "started_at": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+                "elapsed": round(elapsed, 3),
+                "stages": stages,
+                "requests": {endpoint: dict(sorted(by_status.items())) for endpoint, by_status in sorted(self.requests.items())},
+                "bytes": transferred,
+                "sleep": {
+                    "total": round(sum(self.sleep.values()), 3),
+                    "by_reason": {reason: round(seconds, 3) for reason, seconds in sorted(self.sleep.items())},
+                },
+                "counters": extra or {},
+            }
+
+    def write_report(self, report_dir, name, extra=None):
+        """把报告写入 report_dir/<name>-<开始时间>.json, 返回文件路径"""
+        os.makedirs(report_dir, exist_ok=True)
+        stamp = datetime.fromtimestamp(self.started).strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(report_dir, f"{name}-{stamp}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(extra), f, ensure_ascii=False, indent=2)
+        print(f"运行报告已写入: {path}")
+        return path
+
+@contextmanager
+def profiled(path):
+    """
+    path 不为空时用 cProfile 分析这段代码, 结束后写入 path, 可用 pstats 或 snakeviz 查看
+    cProfile 只统计调用它的线程, 线程池中的下载与请求需结合运行报告分析
+    """
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"性能分析结果已写入: {path}")
@@ -0,0 +1,145 @@
+import json
+
+# 动态类型 -> 评论区 type 参数
+COMMENT_TYPE_MAP = {
+    "DYNAMIC_TYPE_DRAW": 11,
+    "DYNAMIC_TYPE_WORD": 17,
+    "DYNAMIC_TYPE_FORWARD": 17
+}
+
+class Dynamic:
+    """
+    统一的动态记录, 由 space_history / web-dynamic/v1/detail / feed/space 三种返回格式转换而来
+    正文与图片只在第一次访问时解析, 已知而被跳过的动态不会解析 card
+    """
+    __slots__ = (
+        "dynamic_id", "timestamp", "pinned",
+        "comment_oid", "comment_type", "comment_count",
+        "_source", "_decoder", "_content", "_pictures",
+    )
+
+    def __init__(self, dynamic_id, timestamp, pinned=False, comment_oid=None, comment_type=17,
+                 comment_count=None, source=None, decoder=None):
+        self.dynamic_id = str(dynamic_id) if dynamic_id else None
+        self.timestamp = timestamp
+        self.pinned = pinned
+        self.comment_oid = comment_oid or self.dynamic_id
+        self.comment_type = comment_type
+        self.comment_count = comment_count
+        self._source = source
+        self._decoder = decoder
+        self._content = None
+        self._pictures = None
+
+    @property
+    def url(self):
+        return f"https://t.bilibili.com/{self.dynamic_id}"
+
+    def _decode(self):
+        if self._decoder is not None:
+            self._content, self._pictures = self._decoder(self._source)
+            self._decoder = None
+            self._source = None
+
+    @property
+    def content(self):
+        """动态正文"""
+        self._decode()
+        return self._content or ""
+
+    @property
+    def pictures(self):
+        """图片列表, 每项为 {"img_src", "img_width", "img_height", "img_size"}"""
+        self._decode()
+        return self._pictures or []
+
+    @classmethod
+    def from_space_history(cls, card):
+        """space_history 的 cards 项: desc + JSON 字符串形式的 card"""
+        desc = card.get("desc") or {}
+        dynamic_id = desc.get("dynamic_id_str") or desc.get("dynamic_id")
+        # type 2 为图文动态, 评论区挂在 rid 上
+        is_draw = desc.get("type") == 2
+        return cls(
+            dynamic_id,
+            desc.get("timestamp"),
+            pinned=(card.get("extra") or {}).get("is_space_top") == 1,
+            comment_oid=desc.get("rid") if is_draw else None,
+            comment_type=11 if is_draw else 17,
+            comment_count=(desc.get("comment") if "comment" in desc else None),
+            source=card.get("card", ""),
+            decoder=_decode_legacy_card,
+        )
+
+    @classmethod
+    def from_detail(cls, item):
+        """web-dynamic/v1/detail 的 data.item; 兼容旧的 desc + card 结构"""
+        if "desc" in item and "card" in item:
+            return cls.from_space_history(item)
+        return cls.from_polymer(item)
+
+    @classmethod
+    def from_feed_space(cls, item):
+        """feed/space 的 items 项"""
+        return cls.from_polymer(item)
+
+    @classmethod
+    def from_polymer(cls, item):
+        modules = item.get("modules") or {}
+        basic = item.get("basic") or {}
+        author = modules.get("module_author") or {}
+        tag = modules.get("module_tag") or {}
+        stat = (modules.get("module_stat") or {}).get("comment") or {}
+
+        comment_type = basic.get("comment_type") or COMMENT_TYPE_MAP.get(item.get("type"), 17)
+        comment_oid = basic.get("comment_id_str")
+        if not comment_oid and comment_type == 11:
+            draw = ((modules.get("module_dynamic") or {}).get("major") or {}).get("draw") or {}
+            comment_oid = draw.get("id")
+        return cls(
+            item.get("id_str"),
+            author.get("pub_ts"),
+            pinned=tag.get("text") == "置顶",
+            comment_oid=str(comment_oid) if comment_oid else None,
+            comment_type=comment_type,
+            comment_count=stat.get("count"),
+            source=modules,
+            decoder=_decode_polymer_modules,
+        )
+
+def _decode_legacy_card(card):
+    # detail 接口的 card 已经是 dict, 不再经过 dumps/loads
+    if isinstance(card, str):
+        try:
+            card = json.loads(card) if card else {}
+        except Exception as e:
+            print("解析 card 失败:", e)
+            return "", []
+    item = card.get("item") or {}
+    content = item.get("description", item.get("content", ""))
+    return content, item.get("pictures") or []
+
+def _decode_polymer_modules(modules):
+    module_dynamic = modules.get("module_dynamic") or {}
+    major = module_dynamic.get("major") or {}
+    content = ((module_dynamic.get("desc") or {}).get("text")) or ""
+    pictures = []
+    if major.get("draw"):
+        for pic in major["draw"].get("items") or []:
+            pictures.append({
+                "img_src": pic.get("src"),
+                "img_width": pic.get("width"),
+                "img_height": pic.get("height"),
+                "img_size": pic.get("size"),
+            })
+    elif major.get("opus"):
+        opus = major["opus"]
+        content = content or ((opus.get("summary") or {}).get("text")) or ""
+        for pic in opus.get("pics") or []:
+            pictures.append({
+                "img_src": pic.get("url"),
+                "img_width": pic.get("width"),
+                "img_height": pic.get("height"),
+                "img_size": pic.get("size"),
+            })
+    return content, pictures
@@ -0,0 +1,179 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+THUMB_DIR = ".thumbs"
+# JPEG 中存放元数据的段: APP1 (EXIF/XMP)、APP13 (IPTC/Photoshop)、COM
+JPEG_METADATA_MARKERS = {0xE1, 0xED, 0xFE}
+
+class PostProcessor:
+    """
+    下载完成后的图片后处理: 生成缩略图、无损重压缩大 PNG、去除元数据
+    在进程池中运行, 不占用下载线程; 处理过的文件记录在状态库中, 之后不会再处理
+    """
+    def __init__(self, state, base_dir, workers=0, thumbnail_size=0, recompress_png_kb=0, strip_metadata=False):
+        """
+        :param state: StateStore, 记录已处理的文件
+        :param base_dir: 记录文件时使用相对于该目录的路径
+        :param workers: 进程数, 0 表示关闭后处理
+        :param thumbnail_size: 缩略图最长边 (像素), 写入图片所在目录的 .thumbs 子目录, 0 表示不生成
+        :param recompress_png_kb: 大于这个大小 (KB) 的 PNG 做无损重压缩, 0 表示不处理
+        :param strip_metadata: 是否去除 JPEG/PNG 中的 EXIF 等元数据
+        """
+        self.state = state
+        self.base_dir = base_dir
+        self.options = {
+            "thumbnail_size": thumbnail_size,
+            "recompress_png_kb": recompress_png_kb,
+            "strip_metadata": strip_metadata,
+        }
+        self.pool = None
+        self.lock = threading.Lock()
+        self.in_flight = set()
+        self.processed = 0
+        self.saved_bytes = 0
+        if workers > 0 and any(self.options.values()):
+            if Image is None:
+                print("未安装 Pillow (pip install Pillow), 跳过图片后处理")
+            else:
+                self.pool = ProcessPoolExecutor(max_workers=workers)
+
+    @property
+    def enabled(self):
+        return self.pool is not None
+
+    def submit(self, filepath, url=None):
+        """
+        提交一张已下载完成的图片, 已处理过的直接跳过
+        :param url: 图片地址, 给出时处理后同步更新图片清单中的文件大小
+        """
+        if self.pool is None:
+            return
+        key = os.path.relpath(filepath, self.base_dir)
+        with self.lock:
+            if key in self.in_flight or self.state.is_processed(key):
+                return
+            self.in_flight.add(key)
+        future = self.pool.submit(process_image, filepath, self.options)
+        future.add_done_callback(lambda done: self._record(done, key, url))
+
+    def _record(self, future, key, url):
+        with self.lock:
+            self.in_flight.discard(key)
+        try:
+            filepath, old_size, new_size, actions = future.result()
+        except Exception as e:
+            print(f"图片后处理出错 {key}: {e}")
+            return
+        self.state.record_processed(key, new_size, ",".join(actions))
+        if url:
+            # 清单中的大小与处理后的文件一致, 下次运行才会把它当作完整文件跳过
+            self.state.record_file(key, url, new_size)
+        with self.lock:
+            self.processed += 1
+            self.saved_bytes += old_size - new_size
+
+    def print_stats(self):
+        if self.processed:
+            print(f"图片后处理: {self.processed} 张, 体积减少 {self.saved_bytes / 1024 / 1024:.1f} MB")
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+def process_image(filepath, options):
+    """
+    在子进程中处理单张图片, 结果先写入新文件再 os.replace 覆盖,
+    不会修改与内容仓库硬链接共享的原文件
+    :return: (filepath, 原大小, 处理后大小, 执行的操作列表)
+    """
+    old_size = os.path.getsize(filepath)
+    actions = []
+    tmp_path = filepath + ".post"
+    with Image.open(filepath) as image:
+        image_format = image.format
+        if options["thumbnail_size"]:
+            _write_thumbnail(image, filepath, options["thumbnail_size"])
+            actions.append("thumbnail")
+
+        strip = options["strip_metadata"] and image_format in ("JPEG", "PNG") and _has_metadata(image)
+        recompress = (image_format == "PNG" and options["recompress_png_kb"]
+                      and old_size > options["recompress_png_kb"] * 1024)
+        if getattr(image, "is_animated", False):
+            # APNG 重新保存只会写入当前一帧, 动图保持原样
+            strip = recompress = False
+        if image_format == "JPEG":
+            # 解码后重新编码总会损失画质, JPEG 只在字节层面删掉元数据段
+            if strip:
+                strip = _strip_jpeg_metadata(filepath, tmp_path)
+        elif strip or recompress:
+            # 重新保存时 Pillow 默认不写入 EXIF, 不去除元数据时显式保留; ICC 色彩配置始终保留
+            save_kwargs = {"icc_profile": image.info.get("icc_profile")}
+            if not strip and image.info.get("exif"):
+                save_kwargs["exif"] = image.info["exif"]
+            image.save(tmp_path, "PNG", optimize=bool(recompress), **save_kwargs)
+    if os.path.exists(tmp_path):
+        if strip:
+            actions.append("strip")
+        if recompress:
+            actions.append("recompress")
+        # 只去除元数据时总是替换, 单纯重压缩没有变小则保留原文件
+        if strip or os.path.getsize(tmp_path) < old_size:
+            os.replace(tmp_path, filepath)
+        else:
+            os.remove(tmp_path)
+    return filepath, old_size, os.path.getsize(filepath), actions
+
+def _has_metadata(image):
+    return bool(image.info.get("exif") or image.info.get("xmp") or image.info.get("comment")
+                or image.info.get("photoshop") or getattr(image, "text", None))
+
+def _strip_jpeg_metadata(filepath, tmp_path):
+    """
+    逐段复制 JPEG 并跳过 JPEG_METADATA_MARKERS 中的段, 量化表、ICC 色彩配置与压缩数据原样保留
+    :return: 是否删掉了元数据段, 没有时不写入 tmp_path
+    """
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    if data[:2] != b"\xff\xd8":
+        return False
+    kept = [data[:2]]
+    pos = 2
+    removed = False
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # 段之间的填充字节
+            pos += 1
+            continue
+        if marker in (0xDA, 0xD9):
+            # SOS 之后是压缩数据, 连同文件剩余部分原样保留
+            break
+        end = pos + 2 + int.from_bytes(data[pos + 2:pos + 4], "big")
+        if marker in JPEG_METADATA_MARKERS:
+            removed = True
+        else:
+            kept.append(data[pos:end])
+        pos = end
+    if not removed:
+        return False
+    kept.append(data[pos:])
+    with open(tmp_path, 'wb') as f:
+        f.writelines(kept)
+    return True
+
+def _write_thumbnail(image, filepath, size):
+    folder, name = os.path.split(filepath)
+    thumb_folder = os.path.join(folder, THUMB_DIR)
+    os.makedirs(thumb_folder, exist_ok=True)
+    # 动图只取第一帧
+    thumb = image.copy()
+    thumb.thumbnail((size, size))
+    if thumb.mode not in ("RGB", "L"):
+        thumb = thumb.convert("RGB")
+    thumb.save(os.path.join(thumb_folder, os.path.splitext(name)[0] + ".jpg"), "JPEG", quality=85)
@@ -0,0 +1,115 @@
+import random
+import threading
+import time
+
+# 触发限流的 HTTP 状态码与 B站风控返回码
+THROTTLE_STATUS = {412, 429}
+RISK_CONTROL_CODES = {-412, -352, -509, -799}
+
+# 各接口类别的 (初始速率, 最大速率), 单位: 次/秒
+DEFAULT_LIMITS = {
+    "feed": (0.5, 2.0),       # space_history / feed/space 动态列表
+    "detail": (0.5, 2.0),     # web-dynamic/v1/detail 动态详情
+    "reply": (1.5, 5.0),      # reply/main 评论
+    "user_info": (0.3, 1.0),  # x/space/acc/info 用户信息
+    "image": (6.0, 30.0),     # i0/i1/i2.hdslb.com 图片
+}
+
+class TokenBucket:
+    """单个接口类别的自适应令牌桶: 被限流时速率减半并冷却, 连续成功后逐步提速"""
+    def __init__(self, rate, max_rate, min_rate=None, jitter=0.2):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate or rate / 8
+        self.jitter = jitter
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.cooldown = 0.0
+        self.success_streak = 0
+        self.requests = 0
+        self.throttled = 0
+        self.slept = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌, 必要时等待; 返回等待的秒数"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # 令牌不足时预支, 让并发的请求依次排队
+            self.tokens -= 1.0
+            wait = max(-self.tokens / self.rate, self.blocked_until - now, 0.0)
+            if wait > 0:
+                wait *= random.uniform(1.0, 1.0 + self.jitter)
+            self.requests += 1
+            self.slept += wait
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def on_throttled(self):
+        with self.lock:
+            self.throttled += 1
+            self.success_streak = 0
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.cooldown = min(max(self.cooldown * 2, 5.0), 300.0)
+            self.blocked_until = time.monotonic() + self.cooldown
+            self.tokens = 0.0
+
+    def on_success(self):
+        with self.lock:
+            self.success_streak += 1
+            if self.success_streak >= 5:
+                self.success_streak = 0
+                self.rate = min(self.max_rate, self.rate * 1.1)
+                self.cooldown = self.cooldown / 2 if self.cooldown > 5.0 else 0.0
+
+class RateLimiter:
+    """按接口类别管理令牌桶的中央限速器"""
+    def __init__(self, limits=None):
+        """
+        :param limits: 覆盖默认速率, 如 {"image": [10, 40]}
+        """
+        merged = dict(DEFAULT_LIMITS)
+        for endpoint, (rate, max_rate) in (limits or {}).items():
+            merged[endpoint] = (rate, max_rate)
+        self.buckets = {endpoint: TokenBucket(rate, max_rate) for endpoint, (rate, max_rate) in merged.items()}
+        self.lock = threading.Lock()
+
+    def bucket(self, endpoint):
+        with self.lock:
+            if endpoint not in self.buckets:
+                rate, max_rate = DEFAULT_LIMITS["feed"]
+                self.buckets[endpoint] = TokenBucket(rate, max_rate)
+            return self.buckets[endpoint]
+
+    def acquire(self, endpoint):
+        return self.bucket(endpoint).acquire()
+
+    def report(self, endpoint, status_code, api_code=0):
+        """
+        记录一次响应结果
+        :return: 是否被限流
+        """
+        bucket = self.bucket(endpoint)
+        if status_code in THROTTLE_STATUS or api_code in RISK_CONTROL_CODES:
+            bucket.on_throttled()
+            return True
+        if status_code < 500:
+            bucket.on_success()
+        return False
+
+    def total_slept(self):
+        return sum(bucket.slept for bucket in self.buckets.values())
+
+    def print_stats(self):
+        used = {endpoint: bucket for endpoint, bucket in self.buckets.items() if bucket.requests}
+        if not used:
+            return
+        print("限速统计:")
+        for endpoint, bucket in sorted(used.items()):
+            print(f" - {endpoint}: 请求 {bucket.requests} 次, 被限流 {bucket.throttled} 次, "
+                  f"当前速率 {bucket.rate:.2f}/s, 等待 {bucket.slept:.1f} 秒")
+        print(f"限速等待合计 {self.total_slept():.1f} 秒")
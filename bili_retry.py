@@ -0,0 +1,33 @@
+import random
+import requests
+
+# detail 接口表示动态不存在或已被删除的返回码, 重试也不会成功
+PERMANENT_DETAIL_CODES = {-404, 4101131}
+# 重试也不会改变结果的 HTTP 状态码
+PERMANENT_HTTP_STATUS = {404, 410}
+
+class RetryPolicy:
+    """指数退避加随机抖动: 第 n 次失败后等待 base_delay * 2^(n-1) 秒 (不超过 max_delay), 失败 max_attempts 次后放弃"""
+    def __init__(self, max_attempts=5, base_delay=30.0, max_delay=21600.0, jitter=0.5):
+        """
+        :param max_attempts: 累计失败多少次后转入死信, 0 表示一直重试
+        :param jitter: 等待时间在 [1, 1 + jitter] 倍之间随机, 避免同时失败的任务同时重试
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempts):
+        """第 attempts 次失败后距下次重试的秒数"""
+        delay = min(self.max_delay, self.base_delay * 2 ** max(attempts - 1, 0))
+        return delay * random.uniform(1.0, 1.0 + self.jitter)
+
+    def exhausted(self, attempts):
+        return bool(self.max_attempts) and attempts >= self.max_attempts
+
+def is_permanent_error(error):
+    """请求异常是否为重试无效的永久错误; 超时、连接中断、5xx 等视为暂时错误"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in PERMANENT_HTTP_STATUS
+    return False
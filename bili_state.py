@@ -0,0 +1,452 @@
+import os
+import sqlite3
+import threading
+import time
+from bili_retry import RetryPolicy
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dynamics (
+    uid TEXT NOT NULL,
+    dynamic_id TEXT NOT NULL,
+    time_num INTEGER,
+    status TEXT NOT NULL,
+    reason TEXT,
+    updated_at INTEGER NOT NULL,
+    PRIMARY KEY (uid, dynamic_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_dynamics_status_time ON dynamics (uid, status, time_num);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    url TEXT,
+    size INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS processed_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    actions TEXT,
+    processed_at INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS comment_cursors (
+    oid TEXT NOT NULL,
+    comment_type INTEGER NOT NULL,
+    last_rpid INTEGER,
+    reply_count INTEGER,
+    pub_ts INTEGER,
+    crawled_at INTEGER NOT NULL,
+    PRIMARY KEY (oid, comment_type)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS users (
+    uid TEXT PRIMARY KEY,
+    legacy_time_num INTEGER,
+    imported_at INTEGER
+);
+CREATE TABLE IF NOT EXISTS post_times (
+    uid TEXT NOT NULL,
+    time_num INTEGER NOT NULL,
+    PRIMARY KEY (uid, time_num)
+) WITHOUT ROWID;
+"""
+
+# 后续版本为已有表补充的列
+USER_COLUMNS = {
+    "checkpoint_id": "TEXT",
+    "checkpoint_ts": "INTEGER",
+    "username": "TEXT",
+    "face": "TEXT",
+    "last_seen": "INTEGER",
+    "dates_imported_at": "INTEGER",
+    "planned_checkpoint_id": "TEXT",
+    "planned_checkpoint_ts": "INTEGER",
+}
+DYNAMIC_COLUMNS = {
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "next_attempt_at": "INTEGER",
+}
+
+STATUS_SAVED = "saved"
+STATUS_FAILED = "failed"
+# 永久错误或重试次数用尽, 不再自动重试
+STATUS_DEAD = "dead"
+# 计划模式已把图片写入任务清单, 等执行端下载后合并结果
+STATUS_PLANNED = "planned"
+
+class StateStore:
+    """
+    基于 SQLite (WAL) 的抓取状态库, 替代每个用户目录下的 saved_url.txt / unsaved_url.txt / date.log
+    写入先缓存在内存中, 由调用方按页 flush 成一个事务
+    状态为 failed 的动态即持久化的重试队列, 每次失败按 retry_policy 安排下次重试时间
+    """
+    def __init__(self, db_path, retry_policy=None):
+        self.db_path = db_path
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._add_missing_columns("users", USER_COLUMNS)
+        self._add_missing_columns("dynamics", DYNAMIC_COLUMNS)
+        self.lock = threading.RLock()
+        self.pending = {}
+        self.pending_files = {}
+        self.pending_processed = {}
+
+    def _add_missing_columns(self, table, columns):
+        existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+        for name, column_type in columns.items():
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+    def is_saved(self, uid, dynamic_id):
+        with self.lock:
+            pending = self.pending.get((uid, dynamic_id))
+            if pending is not None:
+                return pending[1] == STATUS_SAVED
+            row = self.conn.execute(
+                "SELECT 1 FROM dynamics WHERE uid = ? AND dynamic_id = ? AND status = ?",
+                (uid, dynamic_id, STATUS_SAVED)
+            ).fetchone()
+            return row is not None
+
+    def status(self, uid, dynamic_id):
+        """动态当前的状态, 没有记录时返回 None"""
+        with self.lock:
+            pending = self.pending.get((uid, dynamic_id))
+            if pending is not None:
+                return pending[1]
+            row = self.conn.execute(
+                "SELECT status FROM dynamics WHERE uid = ? AND dynamic_id = ?", (uid, dynamic_id)
+            ).fetchone()
+            return row[0] if row else None
+
+    def mark_saved(self, uid, dynamic_id, time_num):
+        with self.lock:
+            self.pending[(uid, dynamic_id)] = (time_num, STATUS_SAVED, None)
+
+    def mark_failed(self, uid, dynamic_id, reason="", time_num=None):
+        with self.lock:
+            self.pending[(uid, dynamic_id)] = (time_num, STATUS_FAILED, reason)
+
+    def mark_dead(self, uid, dynamic_id, reason="", time_num=None):
+        """永久错误 (如动态已删除), 直接转入死信"""
+        with self.lock:
+            self.pending[(uid, dynamic_id)] = (time_num, STATUS_DEAD, reason)
+
+    def mark_planned(self, uid, dynamic_id, time_num):
+        with self.lock:
+            self.pending[(uid, dynamic_id)] = (time_num, STATUS_PLANNED, None)
+
+    def file_size(self, path):
+        """图片清单中记录的文件大小, 未记录时返回 None"""
+        with self.lock:
+            pending = self.pending_files.get(path)
+            if pending is not None:
+                return pending[1]
+            row = self.conn.execute("SELECT size FROM files WHERE path = ?", (path,)).fetchone()
+            return row[0] if row else None
+
+    def record_file(self, path, url, size):
+        with self.lock:
+            self.pending_files[path] = (url, size)
+
+    def is_processed(self, path):
+        """图片是否已经过后处理"""
+        with self.lock:
+            if path in self.pending_processed:
+                return True
+            return self.conn.execute("SELECT 1 FROM processed_files WHERE path = ?", (path,)).fetchone() is not None
+
+    def record_processed(self, path, size, actions):
+        with self.lock:
+            self.pending_processed[path] = (size, actions)
+
+    def flush(self):
+        """把缓存的状态变更写入数据库"""
+        with self.lock:
+            if not self.pending and not self.pending_files and not self.pending_processed:
+                return
+            now = int(time.time())
+            file_rows = [(path, url, size, now) for path, (url, size) in self.pending_files.items()]
+            processed_rows = [(path, size, actions, now) for path, (size, actions) in self.pending_processed.items()]
+            rows = [
+                (uid, dynamic_id, time_num) + self._schedule(uid, dynamic_id, status, reason, now) + (now,)
+                for (uid, dynamic_id), (time_num, status, reason) in self.pending.items()
+            ]
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO dynamics (uid, dynamic_id, time_num, status, reason, attempts, next_attempt_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (uid, dynamic_id) DO UPDATE SET "
+                    "time_num = COALESCE(excluded.time_num, dynamics.time_num), "
+                    "status = excluded.status, reason = excluded.reason, attempts = excluded.attempts, "
+                    "next_attempt_at = excluded.next_attempt_at, updated_at = excluded.updated_at",
+                    rows
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO files (path, url, size, updated_at) VALUES (?, ?, ?, ?)",
+                    file_rows
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO processed_files (path, size, actions, processed_at) VALUES (?, ?, ?, ?)",
+                    processed_rows
+                )
+            self.pending.clear()
+            self.pending_files.clear()
+            self.pending_processed.clear()
+
+    def _schedule(self, uid, dynamic_id, status, reason, now):
+        """
+        计算一次状态变更后的重试安排
+        :return: (status, reason, attempts, next_attempt_at)
+        """
+        row = self.conn.execute(
+            "SELECT attempts FROM dynamics WHERE uid = ? AND dynamic_id = ?", (uid, dynamic_id)
+        ).fetchone()
+        attempts = row[0] if row else 0
+        if status in (STATUS_SAVED, STATUS_PLANNED):
+            return status, reason, attempts, None
+        attempts += 1
+        if status == STATUS_FAILED and self.retry_policy.exhausted(attempts):
+            return STATUS_DEAD, f"{reason} (失败 {attempts} 次, 不再重试)", attempts, None
+        if status == STATUS_DEAD:
+            return status, reason, attempts, None
+        return status, reason, attempts, int(now + self.retry_policy.delay(attempts))
+
+    def latest_time_num(self, uid):
+        """已保存动态中最新的发布时间 (YYYYMMDDHHMM), 对应原 date.log 的第一行"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT MAX(time_num) FROM dynamics WHERE uid = ? AND status = ?",
+                (uid, STATUS_SAVED)
+            ).fetchone()
+            legacy = self.conn.execute(
+                "SELECT legacy_time_num FROM users WHERE uid = ?", (uid,)
+            ).fetchone()
+        values = [value for value in (row[0], legacy[0] if legacy else None) if value]
+        return max(values) if values else None
+
+    def recent_time_nums(self, uid, limit=20):
+        """
+        最近 limit 条动态的发布时间 (YYYYMMDDHHMM), 从新到旧
+        包括已保存的动态与从 date.log 导入的发布时间 (导入的动态本身没有发布时间)
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT time_num FROM dynamics WHERE uid = ? AND status = ? AND time_num IS NOT NULL "
+                "UNION SELECT time_num FROM post_times WHERE uid = ? "
+                "ORDER BY time_num DESC LIMIT ?",
+                (uid, STATUS_SAVED, uid, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def checkpoint(self, uid):
+        """
+        UID 的高水位线: 已完整抓取到的最新动态
+        :return: (dynamic_id, timestamp), 没有时为 (None, None)
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT checkpoint_id, checkpoint_ts FROM users WHERE uid = ?", (uid,)
+            ).fetchone()
+        if not row or not row[0]:
+            return None, None
+        return int(row[0]), row[1]
+
+    def update_checkpoint(self, uid, dynamic_id, timestamp):
+        """高水位线只前进不后退"""
+        with self.lock:
+            current, _ = self.checkpoint(uid)
+            if current is not None and current >= int(dynamic_id):
+                return
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO users (uid, checkpoint_id, checkpoint_ts) VALUES (?, ?, ?) "
+                    "ON CONFLICT (uid) DO UPDATE SET checkpoint_id = excluded.checkpoint_id, checkpoint_ts = excluded.checkpoint_ts",
+                    (uid, str(dynamic_id), timestamp)
+                )
+
+    def save_planned_checkpoint(self, uid, dynamic_id, timestamp):
+        """
+        计划模式抓取完成时的高水位线候选: 其中的动态还没下载, 等 merge 合并完所有 planned 动态后才生效
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT planned_checkpoint_id FROM users WHERE uid = ?", (uid,)).fetchone()
+            if row and row[0] and int(row[0]) >= int(dynamic_id):
+                return
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO users (uid, planned_checkpoint_id, planned_checkpoint_ts) VALUES (?, ?, ?) "
+                    "ON CONFLICT (uid) DO UPDATE SET planned_checkpoint_id = excluded.planned_checkpoint_id, "
+                    "planned_checkpoint_ts = excluded.planned_checkpoint_ts",
+                    (uid, str(dynamic_id), timestamp)
+                )
+
+    def promote_planned_checkpoint(self, uid):
+        """
+        该 UID 已没有 planned 动态时, 把计划模式的高水位线候选写入高水位线
+        :return: 是否推进了高水位线
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT planned_checkpoint_id, planned_checkpoint_ts FROM users WHERE uid = ?", (uid,)
+            ).fetchone()
+            if not row or not row[0] or self.count_status([uid], STATUS_PLANNED):
+                return False
+            self.update_checkpoint(uid, row[0], row[1])
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE users SET planned_checkpoint_id = NULL, planned_checkpoint_ts = NULL WHERE uid = ?", (uid,)
+                )
+            return True
+
+    def user_info(self, uid):
+        """
+        缓存的用户信息
+        :return: {"username", "face", "last_seen"}, 没有缓存时为 None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT username, face, last_seen FROM users WHERE uid = ?", (uid,)
+            ).fetchone()
+        if not row or not row[0]:
+            return None
+        return {"username": row[0], "face": row[1], "last_seen": row[2]}
+
+    def save_user_info(self, uid, username, face):
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO users (uid, username, face, last_seen) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (uid) DO UPDATE SET username = excluded.username, face = excluded.face, last_seen = excluded.last_seen",
+                    (uid, username, face, int(time.time()))
+                )
+
+    def comment_cursor(self, oid, comment_type):
+        """
+        上次抓取评论区时记录的位置
+        :return: {"last_rpid", "reply_count", "pub_ts", "crawled_at"}, 没有抓取过时为 None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT last_rpid, reply_count, pub_ts, crawled_at FROM comment_cursors WHERE oid = ? AND comment_type = ?",
+                (str(oid), comment_type)
+            ).fetchone()
+        if not row:
+            return None
+        return {"last_rpid": row[0], "reply_count": row[1], "pub_ts": row[2], "crawled_at": row[3]}
+
+    def save_comment_cursor(self, oid, comment_type, last_rpid, reply_count, pub_ts):
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO comment_cursors (oid, comment_type, last_rpid, reply_count, pub_ts, crawled_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (str(oid), comment_type, last_rpid, reply_count, pub_ts, int(time.time()))
+                )
+
+    def failed_ids(self, uid):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT dynamic_id FROM dynamics WHERE uid = ? AND status = ?",
+                (uid, STATUS_FAILED)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def due_retries(self, uid, now=None):
+        """
+        已到重试时间的失败动态, 导入的旧记录没有安排时间, 总是到期
+        :return: [(dynamic_id, attempts)]
+        """
+        now = int(now if now is not None else time.time())
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT dynamic_id, attempts FROM dynamics WHERE uid = ? AND status = ? "
+                "AND (next_attempt_at IS NULL OR next_attempt_at <= ?) ORDER BY next_attempt_at",
+                (uid, STATUS_FAILED, now)
+            ).fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    def next_retry_at(self, uids):
+        """这些 UID 中最早的下次重试时间, 没有待重试的动态时为 None"""
+        uids = list(uids)
+        if not uids:
+            return None
+        placeholders = ", ".join("?" * len(uids))
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT MIN(COALESCE(next_attempt_at, 0)) FROM dynamics WHERE status = ? AND uid IN ({placeholders})",
+                [STATUS_FAILED] + uids
+            ).fetchone()
+        return row[0]
+
+    def count_status(self, uids, status):
+        uids = list(uids)
+        if not uids:
+            return 0
+        placeholders = ", ".join("?" * len(uids))
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT COUNT(*) FROM dynamics WHERE status = ? AND uid IN ({placeholders})",
+                [status] + uids
+            ).fetchone()
+        return row[0]
+
+    def import_legacy(self, uid, saved_url_filename, unsaved_url_filename, date_log_filename):
+        """
+        一次性导入旧版的 saved_url.txt / unsaved_url.txt / date.log
+        date.log 中的全部发布时间存入 post_times, 供估计发帖频率; 早期版本导入时只保留了最大值, 会在这里补导
+        :return: 是否执行了导入
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT imported_at, dates_imported_at FROM users WHERE uid = ?", (uid,)).fetchone()
+            imported = row is not None and row[0] is not None
+            if imported and row[1] is not None:
+                return False
+
+            dates = [int(line) for line in _read_lines(date_log_filename) if line.isdigit()]
+            now = int(time.time())
+            if imported:
+                with self.conn:
+                    self._import_post_times(uid, dates, now)
+                return False
+
+            failed_ids = {_dynamic_id_from_url(url) for url in _read_lines(unsaved_url_filename)}
+            saved_ids = {_dynamic_id_from_url(url) for url in _read_lines(saved_url_filename)}
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO dynamics (uid, dynamic_id, time_num, status, reason, updated_at) "
+                    "VALUES (?, ?, NULL, ?, ?, ?)",
+                    [(uid, dynamic_id, STATUS_SAVED, None, now) for dynamic_id in saved_ids if dynamic_id]
+                    + [(uid, dynamic_id, STATUS_FAILED, "imported", now) for dynamic_id in failed_ids - saved_ids if dynamic_id]
+                )
+                self.conn.execute(
+                    "INSERT INTO users (uid, legacy_time_num, imported_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (uid) DO UPDATE SET legacy_time_num = excluded.legacy_time_num, imported_at = excluded.imported_at",
+                    (uid, max(dates) if dates else None, now)
+                )
+                self._import_post_times(uid, dates, now)
+        if saved_ids or failed_ids or dates:
+            print(f"已从文本文件导入 UID {uid} 的状态: 已保存 {len(saved_ids)} 条, 失败 {len(failed_ids - saved_ids)} 条")
+        return True
+
+    def _import_post_times(self, uid, dates, now):
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO post_times (uid, time_num) VALUES (?, ?)",
+            [(uid, time_num) for time_num in dates]
+        )
+        self.conn.execute("UPDATE users SET dates_imported_at = ? WHERE uid = ?", (now, uid))
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.conn.close()
+
+def _read_lines(filename):
+    if not filename or not os.path.exists(filename):
+        return []
+    with open(filename, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def _dynamic_id_from_url(url):
+    dynamic_id = url.split("/")[-1].split("?")[0]
+    return dynamic_id if dynamic_id.isdigit() else None
@@ -0,0 +1,137 @@
+import os
+import re
+import threading
+from urllib.parse import urlsplit
+
+VARIANT_FORMATS = {"webp", "jpg", "png", "avif"}
+# hdslb 图片地址上的缩放/转码参数, 如 .../0a1b...9f.jpg@1080w_75q.webp
+VARIANT_SUFFIX_PATTERN = re.compile(r"@([\w]+)(\.\w+)?$")
+
+class VariantPolicy:
+    """
+    决定下载 hdslb 图片的哪个版本: 原图, 或由 CDN 按 @{w}w_{h}h_{q}q.{format} 缩放、转码后的版本
+    未设置任何参数时始终下载原图
+    """
+    def __init__(self, max_width=0, max_height=0, quality=0, format="webp",
+                 original_below_kb=0, original_above_kb=0):
+        """
+        :param max_width: 宽度上限 (像素), 0 表示不限
+        :param max_height: 高度上限 (像素), 0 表示不限
+        :param quality: 压缩质量 1-100, 0 表示使用 CDN 默认值
+        :param format: 转码后的格式, webp / jpg / png / avif
+        :param original_below_kb: 原图小于这个大小 (KB) 时直接下载原图
+        :param original_above_kb: 原图大于这个大小 (KB) 时直接下载原图, 0 表示不启用
+        """
+        if format not in VARIANT_FORMATS:
+            raise ValueError(f"不支持的图片格式: {format}")
+        self.max_width = max_width
+        self.max_height = max_height
+        self.quality = quality
+        self.format = format
+        self.original_below_kb = original_below_kb
+        self.original_above_kb = original_above_kb
+
+    @property
+    def enabled(self):
+        return bool(self.max_width or self.max_height or self.quality)
+
+    def choose(self, pic):
+        """
+        :param pic: 图片信息 {"img_src", "img_width", "img_height", "img_size"}
+        :return: (下载地址, 本地文件扩展名)
+        """
+        url = pic.get("img_src") or ""
+        ext = os.path.splitext(urlsplit(url).path)[1].lower() or ".jpg"
+        if not self.enabled or "hdslb.com" not in urlsplit(url).netloc or ext == ".gif":
+            # 动图转码后会丢失动画, 始终保留原图
+            return url, ext
+        size_kb = pic.get("img_size") or 0
+        if size_kb and size_kb < self.original_below_kb:
+            return url, ext
+        if size_kb and self.original_above_kb and size_kb > self.original_above_kb:
+            return url, ext
+
+        # 原图已在尺寸上限以内且不要求压缩质量时, 缩小版不会更小
+        params = self._size_params(pic.get("img_width") or 0, pic.get("img_height") or 0) or []
+        if self.quality:
+            params.append(f"{self.quality}q")
+        if not params:
+            return url, ext
+        return f"{url}@{'_'.join(params)}.{self.format}", f".{self.format}"
+
+    def _size_params(self, width, height):
+        """按比例缩小到上限以内的尺寸参数, 原图已在上限以内时返回 None"""
+        if not width or not height:
+            # 尺寸未知时只给出上限, 由 CDN 按比例缩放
+            params = []
+            if self.max_width:
+                params.append(f"{self.max_width}w")
+            elif self.max_height:
+                params.append(f"{self.max_height}h")
+            return params or None
+        scale = 1.0
+        if self.max_width:
+            scale = min(scale, self.max_width / width)
+        if self.max_height:
+            scale = min(scale, self.max_height / height)
+        if scale >= 1.0:
+            return None
+        return [f"{max(1, int(width * scale))}w", f"{max(1, int(height * scale))}h"]
+
+class VariantSelector:
+    """按键 (UID, 或 "comments" / "dynamics") 选择图片版本策略, 并统计下载缩小版节省的流量"""
+    def __init__(self, specs=None):
+        """
+        :param specs: {"default": {...}, "dynamics": {...}, "<UID>": {...}}, 值为 VariantPolicy 的参数
+        """
+        specs = specs or {}
+        self.default = VariantPolicy(**(specs.get("default") or {}))
+        self.policies = {str(key): VariantPolicy(**spec) for key, spec in specs.items() if key != "default"}
+        self.lock = threading.Lock()
+        self.original_sizes = {}
+        self.variants = 0
+        self.original_bytes = 0
+        self.variant_bytes = 0
+
+    def policy(self, key, fallback=None):
+        """key 没有单独的策略时依次使用 fallback 与 "default" 的策略"""
+        return self.policies.get(str(key)) or self.policies.get(str(fallback)) or self.default
+
+    def choose(self, key, pic, fallback=None):
+        """选择下载地址并记下原图大小, 下载完成后由 record 计算节省的字节数, 调用方最终须 record 或 discard"""
+        url, ext = self.policy(key, fallback).choose(pic)
+        if url != pic.get("img_src") and pic.get("img_size"):
+            with self.lock:
+                self.original_sizes[url] = int(pic["img_size"] * 1024)
+        return url, ext
+
+    def discard(self, url):
+        """下载结束 (失败、跳过或引用已有文件) 后丢弃未被 record 取走的原图大小, 避免常驻运行时无限增长"""
+        with self.lock:
+            self.original_sizes.pop(url, None)
+
+    def record(self, url, size):
+        """记录一次实际下载, size 为下载得到的文件大小"""
+        with self.lock:
+            original = self.original_sizes.pop(url, None)
+            if original is None:
+                return
+            self.variants += 1
+            self.original_bytes += original
+            self.variant_bytes += size
+
+    def print_stats(self):
+        if not self.variants:
+            return
+        saved = max(self.original_bytes - self.variant_bytes, 0)
+        print(f"图片缩小版: {self.variants} 张, 原图约 {self.original_bytes / 1024 / 1024:.1f} MB, "
+              f"实际 {self.variant_bytes / 1024 / 1024:.1f} MB, 节省 {saved / 1024 / 1024:.1f} MB")
+
+def local_filename(url):
+    """图片地址对应的本地文件名, 缩小版为 "<原文件名去扩展名>@<参数>.<格式>", 扩展名与实际格式一致"""
+    name = urlsplit(url).path.rsplit("/", 1)[-1]
+    match = VARIANT_SUFFIX_PATTERN.search(name)
+    if not match:
+        return name
+    stem = os.path.splitext(name[:match.start()])[0]
+    return f"{stem}@{match.group(1)}{match.group(2) or os.path.splitext(name[:match.start()])[1]}"